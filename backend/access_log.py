@@ -0,0 +1,133 @@
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import hashlib
+import json
+import logging
+import queue
+import random
+import sys
+import time
+
+from config import get_settings
+from request_context import start_request, current_request
+
+# Records waiting for the background writer; extra records are dropped, not blocked on
+LOG_QUEUE_SIZE = 10000
+
+access_logger = logging.getLogger("icare.access")
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of raising"""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+class LogFormatter(logging.Formatter):
+    """JSON for access records, the usual text format for everything else"""
+
+    def format(self, record):
+        access = getattr(record, "access", None)
+        if access is None:
+            return super().format(record)
+        return json.dumps({"ts": self.formatTime(record), "type": "access", **access}, separators=(",", ":"))
+
+_listener: Optional[QueueListener] = None
+
+def setup_logging():
+    """Route all logging through a queue so formatting and I/O run on a background thread"""
+    global _listener
+    if _listener:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(LogFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.handlers = [DroppingQueueHandler(log_queue)]
+    root.setLevel(logging.INFO)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+def stop_logging():
+    """Flush queued records and stop the background writer"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+def hash_user_id(user_id: Optional[str]) -> Optional[str]:
+    """Stable pseudonymous id so logs can be correlated without exposing user ids"""
+    if not user_id:
+        return None
+    key = get_settings().jwt_secret.encode()[:64]
+    return hashlib.blake2b(user_id.encode(), key=key, digest_size=8).hexdigest()
+
+def build_command_listener():
+    """pymongo command listener counting DB round trips and DB time per request"""
+    from pymongo import monitoring
+
+    class RequestCommandListener(monitoring.CommandListener):
+        def started(self, event):
+            context = current_request()
+            if context is not None:
+                context.db_round_trips += 1
+
+        def succeeded(self, event):
+            context = current_request()
+            if context is not None:
+                context.db_time_us += event.duration_micros
+
+        def failed(self, event):
+            context = current_request()
+            if context is not None:
+                context.db_time_us += event.duration_micros
+                context.failed_command = event.command_name
+
+    return RequestCommandListener()
+
+class AccessLogMiddleware:
+    """ASGI middleware writing one structured record per request.
+
+    Every 4xx/5xx is logged; other responses are sampled at ACCESS_LOG_SAMPLE_RATE.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.sample_rate = get_settings().access_log_sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        context = start_request()
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if status_code >= 400 or random.random() < self.sample_rate:
+                route = scope.get("route")
+                access_logger.info("access", extra={"access": {
+                    "method": scope["method"],
+                    "route": route.path if route is not None else scope["path"],
+                    "status": status_code,
+                    "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+                    "user": hash_user_id(context.user_id),
+                    "db_round_trips": context.db_round_trips,
+                    "db_ms": round(context.db_time_us / 1000, 2),
+                }})
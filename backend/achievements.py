@@ -0,0 +1,131 @@
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Optional
+from bson import ObjectId
+import logging
+
+from access_log import hash_user_id
+from models import Achievement
+
+logger = logging.getLogger(__name__)
+
+# Milestones: (code, title, state field, threshold)
+MILESTONES = [
+    ("first_session", "Premier pas", "total_sessions", 1),
+    ("sessions_10", "Habitué", "total_sessions", 10),
+    ("sessions_100", "Centurion", "total_sessions", 100),
+    ("hour_saved", "Une heure gagnée", "total_minutes", 60),
+    ("ten_hours_saved", "Dix heures gagnées", "total_minutes", 600),
+    ("day_saved", "Une journée gagnée", "total_minutes", 1440),
+    ("streak_3", "3 jours d'affilée", "best_streak", 3),
+    ("streak_7", "7 jours d'affilée", "best_streak", 7),
+    ("streak_30", "30 jours d'affilée", "best_streak", 30),
+]
+
+# Optimistic concurrency retries when two writes race on the same state document
+MAX_UPDATE_RETRIES = 5
+
+def empty_state(user_id: ObjectId) -> Dict:
+    """Initial achievements state for a user"""
+    return {
+        "user_id": user_id,
+        "total_minutes": 0,
+        "total_sessions": 0,
+        "current_streak": 0,
+        "best_streak": 0,
+        "last_active_day": None,
+        "unlocked": {},
+        "version": 0,
+    }
+
+def apply_time_saved(state: Dict, minutes: int, at: datetime) -> Dict:
+    """Return a new state with one time-saved event applied"""
+    new_state = dict(state)
+    new_state["unlocked"] = dict(state.get("unlocked") or {})
+    new_state["total_minutes"] = state.get("total_minutes", 0) + minutes
+    new_state["total_sessions"] = state.get("total_sessions", 0) + 1
+
+    # Streaks count consecutive UTC days with at least one session.
+    # Events for a day already counted (or older) leave the streak unchanged.
+    day = at.date()
+    last_day = date.fromisoformat(state["last_active_day"]) if state.get("last_active_day") else None
+    if last_day is None or day > last_day:
+        if last_day is not None and day - last_day == timedelta(days=1):
+            new_state["current_streak"] = state.get("current_streak", 0) + 1
+        else:
+            new_state["current_streak"] = 1
+        new_state["last_active_day"] = day.isoformat()
+    new_state["best_streak"] = max(state.get("best_streak", 0), new_state.get("current_streak", 0))
+
+    for code, _title, field, threshold in MILESTONES:
+        if code not in new_state["unlocked"] and new_state[field] >= threshold:
+            new_state["unlocked"][code] = at
+
+    return new_state
+
+def current_streak(state: Optional[Dict], today: Optional[date] = None) -> int:
+    """Streak as of today, 0 if the user skipped a day since the last session"""
+    if not state or not state.get("last_active_day"):
+        return 0
+    today = today or datetime.utcnow().date()
+    last_day = date.fromisoformat(state["last_active_day"])
+    if today - last_day > timedelta(days=1):
+        return 0
+    return state.get("current_streak", 0)
+
+def achievements_list(state: Optional[Dict]) -> List[Achievement]:
+    """Unlocked achievements in milestone order"""
+    unlocked = (state or {}).get("unlocked") or {}
+    return [
+        Achievement(code=code, title=title, unlocked_at=unlocked[code])
+        for code, title, _field, _threshold in MILESTONES
+        if code in unlocked
+    ]
+
+async def get_achievements_state(db, user_id: ObjectId) -> Optional[Dict]:
+    """Read the compact per-user achievements document"""
+    return await db.user_achievements.find_one({"user_id": user_id})
+
+async def record_time_saved(db, user_id: ObjectId, minutes: int, at: Optional[datetime] = None) -> Optional[Dict]:
+    """Incrementally update achievements state for a new time-saved event"""
+    from pymongo.errors import DuplicateKeyError
+    
+    at = at or datetime.utcnow()
+    for _ in range(MAX_UPDATE_RETRIES):
+        state = await get_achievements_state(db, user_id) or empty_state(user_id)
+        version = state.get("version", 0)
+        new_state = apply_time_saved(state, minutes, at)
+        new_state.pop("_id", None)
+        new_state["version"] = version + 1
+        new_state["updated_at"] = datetime.utcnow()
+
+        try:
+            result = await db.user_achievements.update_one(
+                {"user_id": user_id, "version": version},
+                {"$set": new_state},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Another writer created or bumped the document first
+            continue
+        if result.matched_count or result.upserted_id is not None:
+            return new_state
+
+    logger.warning("Could not update achievements for user %s, state will be fixed by replay", hash_user_id(str(user_id)))
+    return None
+
+async def rebuild_achievements(db, user_id: ObjectId) -> Dict:
+    """Rebuild a user's achievements state from their time_sessions history"""
+    state = empty_state(user_id)
+    cursor = db.time_sessions.find(
+        {"user_id": user_id},
+        {"time_saved": 1, "created_at": 1}
+    ).sort("created_at", 1)
+    async for session in cursor:
+        state = apply_time_saved(state, session.get("time_saved", 0), session["created_at"])
+
+    # Bump the version so in-flight incremental writers retry on top of the rebuilt state
+    existing = await get_achievements_state(db, user_id)
+    state["version"] = (existing or {}).get("version", 0) + 1
+    state["updated_at"] = datetime.utcnow()
+    await db.user_achievements.replace_one({"user_id": user_id}, state, upsert=True)
+    return state
@@ -1,51 +1,108 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional, Dict
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from functools import lru_cache
+from typing import Optional, Dict, Tuple
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import os
-from models import TokenData
+from config import get_settings
+from database import get_database
+from request_context import current_request
+from single_flight import single_flight
 from bson import ObjectId
+import time
 
 # Security configuration
-SECRET_KEY = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_HOURS = 24
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Accounts whose status is cached per worker
+ACCOUNT_STATUS_CACHE_SIZE = 100000
+
 security = HTTPBearer()
 
+class AccountStatusCache:
+    """Per-worker cache of whether an account may still make authenticated requests.
+
+    An account is active while its users document exists and has no
+    deletion_requested_at. The status is re-read at most every
+    ACCOUNT_STATUS_CACHE_SECONDS, so a valid JWT stops working within that delay
+    after the account is marked for deletion (immediately on the worker that did it).
+    """
+
+    def __init__(self, max_size: int = ACCOUNT_STATUS_CACHE_SIZE):
+        self.max_size = max_size
+        # user_id -> (expires at, active)
+        self._entries: "OrderedDict[str, Tuple[float, bool]]" = OrderedDict()
+
+    async def is_active(self, user_id: str) -> bool:
+        entry = self._entries.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        db = await get_database()
+        user = await single_flight.do(
+            ("account", user_id),
+            lambda: db.users.find_one({"_id": ObjectId(user_id)}, {"deletion_requested_at": 1})
+        )
+        active = user is not None and not user.get("deletion_requested_at")
+        self._set(user_id, active)
+        return active
+
+    def deactivate(self, user_id: str):
+        """Refuse the account on this worker right away"""
+        self._set(user_id, False)
+
+    def _set(self, user_id: str, active: bool):
+        self._entries[user_id] = (time.monotonic() + get_settings().account_status_cache_seconds, active)
+        self._entries.move_to_end(user_id)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+account_status = AccountStatusCache()
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+@lru_cache()
+def get_pwd_context():
+    """Build the password hashing context on first use (passlib is slow to import)"""
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=get_settings().bcrypt_rounds)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def create_access_token(data: Dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
+    from jose import jwt
+    
+    settings = get_settings()
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
+        expire = datetime.utcnow() + timedelta(hours=settings.jwt_expire_hours)
     
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, settings.jwt_secret, algorithm=ALGORITHM)
     return encoded_jwt
 
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     """Verify JWT token and return user_id"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+    from jose import JWTError, jwt
+    
+    credentials_exception = _credentials_exception()
     
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(credentials.credentials, get_settings().jwt_secret, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
@@ -53,11 +110,18 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
         # Validate ObjectId format
         if not ObjectId.is_valid(user_id):
             raise credentials_exception
+        
+        context = current_request()
+        if context is not None:
+            context.user_id = user_id
             
         return user_id
     except JWTError:
         raise credentials_exception
 
-def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
-    """Get current user ID from JWT token"""
-    return verify_token(credentials)
\ No newline at end of file
+async def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    """Get current user ID from JWT token, refusing deleted accounts and accounts being deleted"""
+    user_id = verify_token(credentials)
+    if not await account_status.is_active(user_id):
+        raise _credentials_exception()
+    return user_id
\ No newline at end of file
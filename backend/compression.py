@@ -0,0 +1,158 @@
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+import zlib
+
+from config import get_settings
+
+# Content types that are never compressed: already compressed, or streams that must not be buffered
+SKIP_CONTENT_TYPES = (b"text/event-stream", b"image/", b"video/", b"audio/", b"application/zip", b"application/gzip")
+
+class GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        # Sync flush so each streamed chunk reaches the client without waiting for the next
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk) + self._compressor.flush()
+
+class BrotliEncoder:
+    def __init__(self, brotli):
+        # Quality 4: faster than gzip -6 with smaller output
+        self._compressor = brotli.Compressor(quality=4)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.process(chunk) + self._compressor.flush()
+
+    def finish(self, chunk: bytes) -> bytes:
+        return self._compressor.process(chunk) + self._compressor.finish()
+
+class ZstdEncoder:
+    def __init__(self, zstandard):
+        self._zstandard = zstandard
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk) + self._compressor.flush(self._zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk) + self._compressor.flush()
+
+@lru_cache()
+def available_encoders() -> Dict[str, Callable[[], object]]:
+    """Encoders usable in this install, in server preference order (brotli and zstd are optional)"""
+    # zstd first: smallest output and least CPU in scripts/bench_encodings
+    encoders: Dict[str, Callable[[], object]] = {}
+    try:
+        import zstandard
+        encoders["zstd"] = lambda: ZstdEncoder(zstandard)
+    except ImportError:
+        pass
+    try:
+        import brotli
+        encoders["br"] = lambda: BrotliEncoder(brotli)
+    except ImportError:
+        pass
+    encoders["gzip"] = GzipEncoder
+    return encoders
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best encoding accepted by the client, ignoring q-values other than q=0"""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0"):
+            accepted.add(name.strip().lower())
+    for encoding in available_encoders():
+        if encoding in accepted:
+            return encoding
+    return None
+
+def _add_vary(headers: List, value: bytes):
+    for index, (name, existing) in enumerate(headers):
+        if name == b"vary":
+            headers[index] = (name, existing + b", " + value)
+            return
+    headers.append((b"vary", value))
+
+class CompressionMiddleware:
+    """ASGI response compression (br, zstd, gzip) with a size threshold.
+
+    Responses smaller than COMPRESSION_MIN_SIZE are sent as is. Streaming responses
+    are compressed chunk by chunk and flushed as they go.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.min_size = get_settings().compression_min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, encoder, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                content_type = next((value for name, value in headers if name == b"content-type"), b"")
+                if any(name == b"content-encoding" for name, _ in headers) or content_type.startswith(SKIP_CONTENT_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Held until the first body chunk tells us the size
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                headers = list(start_message.get("headers", []))
+                if not more_body and len(body) < self.min_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                encoder = available_encoders()[encoding]()
+                headers = [(name, value) for name, value in headers if name != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode()))
+                _add_vary(headers, b"Accept-Encoding")
+                if not more_body:
+                    body = encoder.finish(body)
+                    headers.append((b"content-length", str(len(body)).encode()))
+                    await send({**start_message, "headers": headers})
+                    await send({"type": "http.response.body", "body": body})
+                    start_message = None
+                    return
+                await send({**start_message, "headers": headers})
+                start_message = None
+
+            if more_body:
+                await send({"type": "http.response.body", "body": encoder.compress(body), "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": encoder.finish(body)})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,62 @@
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
+import os
+
+ROOT_DIR = Path(__file__).parent
+
+class Settings:
+    """Application settings, read once from the environment after loading .env"""
+
+    def __init__(self):
+        self.mongo_url: str = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+        self.db_name: str = os.environ.get('DB_NAME', 'icare_db')
+        self.jwt_secret: str = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
+        self.jwt_expire_hours: int = int(os.environ.get('JWT_EXPIRE_HOURS', '24'))
+        self.bcrypt_rounds: int = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+        self.cors_origins: List[str] = [
+            origin.strip() for origin in os.environ.get('CORS_ORIGINS', '*').split(',') if origin.strip()
+        ]
+        # Default per-request deadline, propagated to Mongo operations (see deadlines.py)
+        self.request_deadline_ms: float = float(os.environ.get('REQUEST_DEADLINE_MS', '5000'))
+        # How long Idempotency-Key responses are kept for replay
+        self.idempotency_ttl_hours: int = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+        # Responses smaller than this are not compressed
+        self.compression_min_size: int = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+        # Fraction of non-error requests written to the access log (errors are always logged)
+        self.access_log_sample_rate: float = float(os.environ.get('ACCESS_LOG_SAMPLE_RATE', '1.0'))
+        # Per-request profiling: output directory (disabled when unset), X-Debug-Profile token,
+        # random sampling rate and stack sampling interval
+        self.profile_dir: Optional[str] = os.environ.get('PROFILE_DIR') or None
+        self.profile_token: Optional[str] = os.environ.get('PROFILE_TOKEN') or None
+        self.profile_sample_rate: float = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+        self.profile_interval_ms: float = float(os.environ.get('PROFILE_INTERVAL_MS', '2'))
+        # X-Metrics-Token required by GET /api/metrics (the endpoint is disabled when unset)
+        self.metrics_token: Optional[str] = os.environ.get('METRICS_TOKEN') or None
+        # Seconds between reloads of active locks from MongoDB
+        self.lock_resync_seconds: float = float(os.environ.get('LOCK_RESYNC_SECONDS', '60'))
+        # Open usage sessions are written to MongoDB every SESSION_CHECKPOINT_SECONDS,
+        # and closed after SESSION_IDLE_SECONDS without a heartbeat
+        self.session_checkpoint_seconds: float = float(os.environ.get('SESSION_CHECKPOINT_SECONDS', '60'))
+        self.session_idle_seconds: float = float(os.environ.get('SESSION_IDLE_SECONDS', '45'))
+        # Open usage sessions per user and worker; heartbeats for more are refused
+        self.session_max_per_user: int = int(os.environ.get('SESSION_MAX_PER_USER', '5'))
+        # How long a worker trusts a JWT user's account status (exists, not being deleted)
+        self.account_status_cache_seconds: float = float(os.environ.get('ACCOUNT_STATUS_CACHE_SECONDS', '30'))
+        # Background purge (see purge.py): initial batch size, delete latency above which it backs off,
+        # job queue polling interval, and session retention in days (0 keeps everything)
+        self.purge_batch_size: int = int(os.environ.get('PURGE_BATCH_SIZE', '500'))
+        self.purge_target_latency_ms: float = float(os.environ.get('PURGE_TARGET_LATENCY_MS', '50'))
+        self.purge_poll_seconds: float = float(os.environ.get('PURGE_POLL_SECONDS', '30'))
+        self.retention_days: int = int(os.environ.get('RETENTION_DAYS', '0'))
+        # Platform-wide counters (see global_counters.py): shard documents per platform and day,
+        # and how long GET /api/stats/global serves a cached sum
+        self.global_counter_shards: int = int(os.environ.get('GLOBAL_COUNTER_SHARDS', '16'))
+        self.global_stats_cache_seconds: float = float(os.environ.get('GLOBAL_STATS_CACHE_SECONDS', '5'))
+
+@lru_cache()
+def get_settings() -> Settings:
+    """Load .env (without overriding real environment variables) and build settings once"""
+    from dotenv import load_dotenv
+    load_dotenv(ROOT_DIR / '.env')
+    return Settings()
@@ -0,0 +1,61 @@
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Mapping, Optional
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from starlette.background import BackgroundTask
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_ACCEPT_TYPES = ("application/msgpack", "application/x-msgpack")
+
+_wants_msgpack: ContextVar[bool] = ContextVar("wants_msgpack", default=False)
+
+@lru_cache()
+def get_msgpack():
+    """msgpack module, or None when it is not installed (JSON is then always used)"""
+    try:
+        import msgpack
+        return msgpack
+    except ImportError:
+        return None
+
+def accepts_msgpack(accept: str) -> bool:
+    """Whether Accept lists a MessagePack media type, ignoring q-values other than q=0"""
+    for part in accept.split(","):
+        media_type, *params = part.split(";")
+        if media_type.strip().lower() not in MSGPACK_ACCEPT_TYPES:
+            continue
+        if not any(param.replace(" ", "") in ("q=0", "q=0.0") for param in params):
+            return True
+    return False
+
+async def negotiate_format(request: Request):
+    """Router dependency selecting MessagePack when the client asks for it in Accept"""
+    accept = request.headers.get("accept", "")
+    _wants_msgpack.set(accepts_msgpack(accept) and get_msgpack() is not None)
+
+class NegotiatedResponse(JSONResponse):
+    """JSON by default, MessagePack for requests negotiated by negotiate_format.
+
+    FastAPI hands the response class already JSON-compatible content (datetimes as
+    ISO strings), so it is packed directly without going through JSON first.
+    """
+
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+        background: Optional[BackgroundTask] = None,
+    ):
+        # Explicit signature: FastAPI reads the status_code default for the OpenAPI schema
+        if _wants_msgpack.get():
+            self.media_type = MSGPACK_MEDIA_TYPE
+        super().__init__(content, status_code, headers, media_type, background)
+        self.headers["vary"] = "Accept"
+
+    def render(self, content: Any) -> bytes:
+        if self.media_type == MSGPACK_MEDIA_TYPE:
+            return get_msgpack().packb(content, use_bin_type=True)
+        return super().render(content)
@@ -1,13 +1,16 @@
-from motor.motor_asyncio import AsyncIOMotorClient
-from typing import Optional
-import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, TYPE_CHECKING
+from config import get_settings
+from access_log import build_command_listener
 
-# MongoDB configuration
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-DB_NAME = os.environ.get('DB_NAME', 'icare_db')
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+# Allocation times of the most recent change versions, kept on the users document
+CHANGE_VERSION_TIMES_KEPT = 20
 
 class Database:
-    client: Optional[AsyncIOMotorClient] = None
+    client: Optional["AsyncIOMotorClient"] = None
     database = None
 
 database = Database()
@@ -17,13 +20,73 @@ async def get_database():
 
 async def connect_to_mongo():
     """Create database connection"""
-    database.client = AsyncIOMotorClient(MONGO_URL)
-    database.database = database.client[DB_NAME]
+    # Imported here: motor pulls in pymongo and dnspython, which dominate import time
+    from motor.motor_asyncio import AsyncIOMotorClient
+    
+    settings = get_settings()
+    database.client = AsyncIOMotorClient(settings.mongo_url, event_listeners=[build_command_listener()])
+    database.database = database.client[settings.db_name]
     
     # Create indexes
     await database.database.users.create_index("email", unique=True)
     await database.database.user_preferences.create_index("user_id", unique=True)
     await database.database.time_sessions.create_index([("user_id", 1), ("created_at", -1)])
+    await database.database.time_sessions.create_index([("user_id", 1), ("version", 1)])
+    # Retention purge, oldest sessions first
+    await database.database.time_sessions.create_index("created_at")
+    await database.database.user_achievements.create_index("user_id", unique=True)
+    await database.database.idempotency_keys.create_index(
+        "created_at",
+        expireAfterSeconds=settings.idempotency_ttl_hours * 3600
+    )
+    await database.database.user_preferences.create_index(
+        "lock_end_time",
+        name="active_locks",
+        partialFilterExpression={"lock_mode": True}
+    )
+    await database.database.usage_sessions.create_index([("user_id", 1), ("client_session_id", 1)], unique=True)
+    await database.database.usage_sessions.create_index([("user_id", 1), ("created_at", -1)])
+    await database.database.usage_sessions.create_index("created_at")
+    await database.database.purge_jobs.create_index([("status", 1), ("created_at", 1)])
+    await database.database.global_counters.create_index("day")
+
+def change_settle_seconds() -> float:
+    """Time after which a write that allocated a change version has stamped its document"""
+    return get_settings().request_deadline_ms / 1000
+
+def change_version_update(now: datetime) -> Dict:
+    """Users update allocating the next change version and recording when it was allocated"""
+    return {
+        "$inc": {"change_version": 1},
+        "$push": {"change_version_times": {"$each": [now], "$slice": -CHANGE_VERSION_TIMES_KEPT}}
+    }
+
+def unsettled_versions(user: Dict, now: Optional[datetime] = None) -> List[int]:
+    """Versions allocated too recently to be sure the write that took them has stamped its document.
+
+    The n-th time from the end of change_version_times belongs to change_version - n:
+    both are changed by the same atomic update.
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=change_settle_seconds())
+    version = user.get("change_version", 0)
+    times = user.get("change_version_times") or []
+    versions = [version - offset for offset, at in enumerate(reversed(times)) if at > cutoff]
+    if len(times) == CHANGE_VERSION_TIMES_KEPT and times[0] > cutoff:
+        # More allocations in the window than are kept: the one before the oldest may be in flight too
+        versions.append(version - len(times))
+    return versions
+
+async def next_change_version(db, user_id) -> int:
+    """Allocate the next per-user change version for delta sync"""
+    from pymongo import ReturnDocument
+    
+    user = await db.users.find_one_and_update(
+        {"_id": user_id},
+        change_version_update(datetime.utcnow()),
+        projection={"change_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return user["change_version"] if user else 0
 
 async def close_mongo_connection():
     """Close database connection"""
@@ -0,0 +1,101 @@
+from collections import Counter
+from typing import Dict, Optional
+import asyncio
+import json
+
+from config import get_settings
+from request_context import current_request
+
+# Per-route deadline overrides in milliseconds (path -> budget); None disables the deadline.
+# Other routes use REQUEST_DEADLINE_MS.
+ROUTE_DEADLINES_MS: Dict[str, Optional[float]] = {
+    "/api/auth/register": 5000,
+    "/api/auth/login": 5000,
+    "/api/user/stats": 3000,
+    # Long-lived event stream
+    "/api/user/lock/events": None,
+}
+
+TIMEOUT_BODY = json.dumps({"detail": "Délai de traitement dépassé, veuillez réessayer"}).encode()
+
+# Timeouts per (route, operation); operation is the Mongo command that timed out,
+# or "handler" when the deadline fired outside a DB call
+timeouts = Counter()
+
+def timeout_metrics() -> Dict[str, Dict[str, int]]:
+    """Timeout counts grouped by route then operation"""
+    metrics: Dict[str, Dict[str, int]] = {}
+    for (route, operation), count in sorted(timeouts.items()):
+        metrics.setdefault(route, {})[operation] = count
+    return metrics
+
+class DeadlineMiddleware:
+    """ASGI middleware enforcing a per-route deadline.
+
+    The remaining budget is propagated to every pymongo/motor operation through
+    pymongo.timeout() (client-side operation timeout: maxTimeMS, socket and pool
+    checkout waits are all bounded). The handler is cancelled once the deadline
+    passes and the client gets a fast 503.
+    """
+
+    def __init__(self, app):
+        # Built on first request, so pymongo stays out of the import path
+        import pymongo
+        from pymongo.errors import PyMongoError
+
+        self.app = app
+        self._pymongo_timeout = pymongo.timeout
+        self._mongo_error = PyMongoError
+        self.default_ms = get_settings().request_deadline_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        budget_ms = ROUTE_DEADLINES_MS.get(path, self.default_ms)
+        if not budget_ms:
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        budget = budget_ms / 1000
+        try:
+            with self._pymongo_timeout(budget):
+                async with asyncio.timeout(budget):
+                    await self.app(scope, receive, send_wrapper)
+        except TimeoutError:
+            self._record(path, "handler")
+            await self._reject(send, response_started)
+        except self._mongo_error as error:
+            if not error.timeout:
+                raise
+            context = current_request()
+            self._record(path, (context and context.failed_command) or "unknown")
+            await self._reject(send, response_started)
+
+    def _record(self, path: str, operation: str):
+        timeouts[(path, operation)] += 1
+
+    async def _reject(self, send, response_started: bool):
+        if response_started:
+            # Too late for a status code, the connection is just closed
+            return
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(TIMEOUT_BODY)).encode()),
+                (b"retry-after", b"1"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": TIMEOUT_BODY})
@@ -0,0 +1,55 @@
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+import random
+import time
+
+from config import get_settings
+from single_flight import single_flight
+
+class GlobalCounters:
+    """Platform-wide time-saved totals per UTC day, as sharded counters.
+
+    Each (platform, day) is spread over GLOBAL_COUNTER_SHARDS documents in
+    global_counters; a write increments one shard picked at random, so concurrent
+    time-saved writes rarely contend on the same document. A read sums every shard
+    of the day (whatever the shard count was when they were written) and is cached
+    for GLOBAL_STATS_CACHE_SECONDS.
+    """
+
+    def __init__(self):
+        self._cache: Dict[str, Tuple[float, Dict[str, Dict[str, int]]]] = {}
+
+    async def add(self, db, platform: str, minutes: int, at: Optional[datetime] = None, shards: Optional[int] = None):
+        """Count one time-saved event on a random shard"""
+        day = (at or datetime.utcnow()).date().isoformat()
+        shard = random.randrange(shards or get_settings().global_counter_shards)
+        await db.global_counters.update_one(
+            {"_id": f"{day}:{platform}:{shard}"},
+            {
+                "$inc": {"minutes": minutes, "sessions": 1},
+                "$setOnInsert": {"day": day, "platform": platform, "shard": shard}
+            },
+            upsert=True
+        )
+
+    async def totals(self, db, day: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """Minutes and sessions per platform for a day (today by default), cached"""
+        day = day or datetime.utcnow().date().isoformat()
+        cached = self._cache.get(day)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        # Concurrent cache misses share one read
+        totals = await single_flight.do(("global_counters", day), lambda: self._sum_shards(db, day))
+        self._cache = {day: (time.monotonic() + get_settings().global_stats_cache_seconds, totals)}
+        return totals
+
+    async def _sum_shards(self, db, day: str) -> Dict[str, Dict[str, int]]:
+        totals: Dict[str, Dict[str, int]] = {}
+        async for shard in db.global_counters.find({"day": day}, {"platform": 1, "minutes": 1, "sessions": 1}):
+            platform_totals = totals.setdefault(shard["platform"], {"minutes": 0, "sessions": 0})
+            platform_totals["minutes"] += shard.get("minutes", 0)
+            platform_totals["sessions"] += shard.get("sessions", 0)
+        return totals
+
+global_counters = GlobalCounters()
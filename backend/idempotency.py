@@ -0,0 +1,114 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from fastapi import HTTPException, status
+import hashlib
+import json
+
+# Most recent completed keys kept in memory per worker (MongoDB stays authoritative)
+RECENT_KEYS_SIZE = 10000
+MAX_KEY_LENGTH = 255
+# A reservation without a response older than this is considered abandoned
+# (the worker died, or the request failed after its first write) and can be taken over.
+# Three times the default request deadline, so a request still running is never taken over.
+PENDING_LEASE_SECONDS = 15
+
+class IdempotencyStore:
+    """Idempotency-Key handling backed by the TTL-indexed idempotency_keys collection.
+
+    A key is first reserved with an insert (the unique _id makes concurrent retries
+    race safely across workers), then completed with the response to replay. The
+    reservation also stores a fingerprint of the request body: reusing a key for a
+    different request is rejected with 422.
+    """
+
+    def __init__(self, max_recent: int = RECENT_KEYS_SIZE):
+        self.max_recent = max_recent
+        # doc_id -> (fingerprint, response)
+        self._recent: "OrderedDict[str, Tuple[str, Dict]]" = OrderedDict()
+        self.replayed = 0
+
+    @staticmethod
+    def _doc_id(user_id: str, key: str) -> str:
+        return f"{user_id}:{key}"
+
+    @staticmethod
+    def fingerprint(body: Dict) -> str:
+        """Stable hash of a request body"""
+        return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+
+    @staticmethod
+    def _check_fingerprint(stored: Optional[str], fingerprint: str):
+        if stored is not None and stored != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key déjà utilisé pour une autre requête"
+            )
+
+    def _remember(self, doc_id: str, fingerprint: str, response: Dict):
+        self._recent[doc_id] = (fingerprint, response)
+        self._recent.move_to_end(doc_id)
+        if len(self._recent) > self.max_recent:
+            self._recent.popitem(last=False)
+
+    async def begin(self, db, user_id: str, key: str, fingerprint: str) -> Optional[Dict]:
+        """Reserve the key, or return the original response if it was already used"""
+        from pymongo.errors import DuplicateKeyError
+
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Idempotency-Key trop long"
+            )
+
+        doc_id = self._doc_id(user_id, key)
+        recent = self._recent.get(doc_id)
+        if recent is not None:
+            self._check_fingerprint(recent[0], fingerprint)
+            self.replayed += 1
+            return recent[1]
+
+        try:
+            await db.idempotency_keys.insert_one({
+                "_id": doc_id,
+                "user_id": user_id,
+                "fingerprint": fingerprint,
+                "response": None,
+                "created_at": datetime.utcnow()
+            })
+            return None
+        except DuplicateKeyError:
+            existing = await db.idempotency_keys.find_one({"_id": doc_id})
+
+        if existing:
+            self._check_fingerprint(existing.get("fingerprint"), fingerprint)
+
+        if existing and existing.get("response") is not None:
+            self._remember(doc_id, fingerprint, existing["response"])
+            self.replayed += 1
+            return existing["response"]
+
+        if existing and existing["created_at"] < datetime.utcnow() - timedelta(seconds=PENDING_LEASE_SECONDS):
+            result = await db.idempotency_keys.update_one(
+                {"_id": doc_id, "response": None, "created_at": existing["created_at"]},
+                {"$set": {"created_at": datetime.utcnow()}}
+            )
+            if result.modified_count:
+                return None
+
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Requête identique déjà en cours de traitement"
+        )
+
+    async def complete(self, db, user_id: str, key: str, fingerprint: str, response: Dict):
+        """Store the response to replay for later retries with the same key"""
+        doc_id = self._doc_id(user_id, key)
+        await db.idempotency_keys.update_one({"_id": doc_id}, {"$set": {"response": response}})
+        self._remember(doc_id, fingerprint, response)
+
+    async def abort(self, db, user_id: str, key: str):
+        """Release the reservation of a request that failed before any write"""
+        await db.idempotency_keys.delete_one({"_id": self._doc_id(user_id, key), "response": None})
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,97 @@
+from functools import lru_cache
+from itertools import product
+from typing import Dict, Optional, Tuple
+import hashlib
+import json
+import re
+
+# Preference flags that change the injected script, in variant key order
+SCRIPT_FLAGS = ("hide_reels", "hide_stories", "hide_suggestions")
+
+# CSS selectors hidden for each flag, per platform
+PLATFORM_SELECTORS: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "instagram": {
+        "hide_reels": ('a[href^="/reels/"]', 'a[href*="/reel/"]', 'div[aria-label="Reels"]'),
+        "hide_stories": ('div[role="menu"] ul', 'section > div > div > div[role="presentation"]'),
+        "hide_suggestions": ('div[aria-label="Suggestions"]', 'a[href="/explore/people/"]'),
+    },
+    "tiktok": {
+        "hide_reels": ('div[data-e2e="recommend-list-item-container"]',),
+        "hide_stories": ('div[data-e2e="story-ring"]',),
+        "hide_suggestions": ('div[data-e2e="suggest-accounts"]', 'div[data-e2e="recommend-user"]'),
+    },
+    "youtube": {
+        "hide_reels": ('ytd-reel-shelf-renderer', 'ytd-rich-shelf-renderer[is-shorts]', 'a[title="Shorts"]'),
+        "hide_stories": ('ytd-post-renderer',),
+        "hide_suggestions": ('#related', 'ytd-watch-next-secondary-results-renderer'),
+    },
+    "facebook": {
+        "hide_reels": ('div[aria-label="Reels"]', 'a[href*="/reel/"]'),
+        "hide_stories": ('div[aria-label="Stories"]',),
+        "hide_suggestions": ('div[aria-label="People you may know"]', 'div[data-pagelet*="Suggested"]'),
+    },
+}
+
+# Injected script: one <style> element, replaced on every injection so toggled-off flags are undone
+SCRIPT_TEMPLATE = """
+(function () {
+    // Same id on every injection, so re-running replaces the previous rules
+    var id = "icare-hide";
+    var style = document.getElementById(id);
+    if (!style) {
+        style = document.createElement("style");
+        style.id = id;
+        (document.head || document.documentElement).appendChild(style);
+    }
+    style.textContent = __CSS__;
+})();
+"""
+
+class ScriptVariant:
+    """One built script: body, content hash and the URL it is served under forever"""
+
+    __slots__ = ("platform", "flags", "body", "digest", "etag", "url")
+
+    def __init__(self, platform: str, flags: Tuple[bool, ...], body: bytes):
+        self.platform = platform
+        self.flags = flags
+        self.body = body
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.etag = f'"{self.digest}"'
+        self.url = f"/api/scripts/{platform}/{self.digest}.js"
+
+def minify(source: str) -> str:
+    """Whitespace and comment stripping for SCRIPT_TEMPLATE (no string literal may contain the stripped characters)"""
+    lines = [line.strip() for line in source.splitlines()]
+    code = "".join(line for line in lines if line and not line.startswith("//"))
+    return re.sub(r"\s*([{}()\[\];,=|!])\s*", r"\1", code)
+
+def render(platform: str, flags: Tuple[bool, ...]) -> bytes:
+    selectors = [
+        selector
+        for flag, enabled in zip(SCRIPT_FLAGS, flags) if enabled
+        for selector in PLATFORM_SELECTORS[platform][flag]
+    ]
+    css = ",".join(selectors) + "{display:none!important}" if selectors else ""
+    return minify(SCRIPT_TEMPLATE).replace("__CSS__", json.dumps(css)).encode()
+
+@lru_cache()
+def script_variants() -> Dict[Tuple[str, Tuple[bool, ...]], ScriptVariant]:
+    """Every (platform, flags) variant, built once and kept in memory"""
+    return {
+        (platform, flags): ScriptVariant(platform, flags, render(platform, flags))
+        for platform in PLATFORM_SELECTORS
+        for flags in product((False, True), repeat=len(SCRIPT_FLAGS))
+    }
+
+@lru_cache()
+def variants_by_digest() -> Dict[Tuple[str, str], ScriptVariant]:
+    return {(variant.platform, variant.digest): variant for variant in script_variants().values()}
+
+def variant_for(platform: str, preferences: Dict) -> Optional[ScriptVariant]:
+    """Variant matching a user's preferences, None for an unknown platform"""
+    flags = tuple(bool(preferences.get(flag)) for flag in SCRIPT_FLAGS)
+    return script_variants().get((platform, flags))
+
+def variant_by_digest(platform: str, digest: str) -> Optional[ScriptVariant]:
+    return variants_by_digest().get((platform, digest))
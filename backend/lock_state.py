@@ -0,0 +1,264 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from bson import ObjectId
+import asyncio
+import heapq
+import logging
+
+from config import get_settings
+from database import change_version_update
+
+logger = logging.getLogger(__name__)
+
+# Delay before retrying a failed bulk unlock or a broken change stream
+LOCK_RETRY_SECONDS = 5.0
+# Server error code when change streams are not available (standalone mongod)
+CHANGE_STREAMS_UNSUPPORTED = 40573
+# Server error code when the resume token fell off the oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+
+class LockStateService:
+    """In-memory index of active lock-mode deadlines with bulk expiry.
+
+    Every worker tracks every lock: locks set through other workers arrive through a
+    change stream on user_preferences (or on the periodic resync when the server
+    has no change streams), so each worker publishes unlock events to its own SSE
+    subscribers, whichever worker wrote the unlock.
+    """
+
+    def __init__(self):
+        self._db = None
+        self._locks: Dict[str, datetime] = {}
+        # Min-heap of (lock_end_time, user_id); entries not matching self._locks are stale
+        self._heap: List[Tuple[datetime, str]] = []
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watch_task: Optional[asyncio.Task] = None
+        self._resume_token = None
+        self._last_sync: Optional[datetime] = None
+
+    async def start(self, db):
+        """Load active locks and start the expiry loop"""
+        self._db = db
+        self._wakeup = asyncio.Event()
+        await self._load()
+        self._task = asyncio.create_task(self._run())
+        self._watch_task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        """Stop the expiry loop and the change stream"""
+        for task in (self._task, self._watch_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._watch_task = None
+
+    def is_locked(self, user_id: str) -> bool:
+        """Whether the user currently has an active lock, without a DB read"""
+        end = self._locks.get(user_id)
+        return end is not None and datetime.utcnow() < end
+
+    def lock_end_time(self, user_id: str) -> Optional[datetime]:
+        return self._locks.get(user_id) if self.is_locked(user_id) else None
+
+    def update_from_preferences(self, user_id: str, prefs: Dict):
+        """Track or forget a user's lock after their preferences changed"""
+        end = prefs.get("lock_end_time")
+        if prefs.get("lock_mode") and end and datetime.utcnow() < end:
+            self._set(user_id, end)
+        else:
+            self._locks.pop(user_id, None)
+
+    async def refresh(self, user_id: str):
+        """Read a user's lock from the DB, in case it was set through a worker not seen yet"""
+        prefs = await self._db.user_preferences.find_one(
+            {"user_id": ObjectId(user_id)},
+            {"lock_mode": 1, "lock_end_time": 1}
+        )
+        self.update_from_preferences(user_id, prefs or {})
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        """Register a queue that receives this user's unlock events"""
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def _set(self, user_id: str, end: datetime):
+        self._locks[user_id] = end
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (end, user_id))
+        # Wake the loop if this lock expires before the one it is sleeping on
+        if self._wakeup and (earliest is None or end < earliest):
+            self._wakeup.set()
+
+    async def _load(self):
+        """Rebuild the index from the active_locks partial index"""
+        now = datetime.utcnow()
+        collection = self._db.user_preferences
+
+        # Locks that expired while no worker was running
+        await self._clear_locks(None, now)
+
+        locks = {}
+        cursor = collection.find(
+            {"lock_mode": True, "lock_end_time": {"$gt": now}},
+            {"user_id": 1, "lock_end_time": 1}
+        )
+        async for prefs in cursor:
+            locks[str(prefs["user_id"])] = prefs["lock_end_time"]
+
+        self._locks = locks
+        self._heap = [(end, user_id) for user_id, end in locks.items()]
+        heapq.heapify(self._heap)
+        self._last_sync = now
+        logger.info("Loaded %d active locks", len(locks))
+
+    def _seconds_until_next_event(self) -> float:
+        # Locks set through other workers come from the change stream, or from the resync without one
+        timeout = get_settings().lock_resync_seconds
+        if self._last_sync:
+            timeout -= (datetime.utcnow() - self._last_sync).total_seconds()
+        if self._heap:
+            timeout = min(timeout, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+        return max(timeout, 0)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._seconds_until_next_event())
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                await self._expire_due()
+                if (datetime.utcnow() - self._last_sync).total_seconds() >= get_settings().lock_resync_seconds:
+                    await self._load()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Lock expiry failed, retrying in %ss", LOCK_RETRY_SECONDS)
+                await asyncio.sleep(LOCK_RETRY_SECONDS)
+
+    async def _expire_due(self):
+        """Clear every lock whose deadline has passed in one bulk write"""
+        now = datetime.utcnow()
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            end, user_id = heapq.heappop(self._heap)
+            if self._locks.get(user_id) == end:
+                expired.append((end, user_id))
+        if not expired:
+            return
+
+        try:
+            await self._clear_locks([ObjectId(user_id) for _, user_id in expired], now)
+        except Exception:
+            # Put them back so the next pass retries
+            for entry in expired:
+                heapq.heappush(self._heap, entry)
+            raise
+
+        for end, user_id in expired:
+            # A new lock may have been set, or the unlock already published from the change stream
+            if self._locks.get(user_id) == end:
+                del self._locks[user_id]
+                self._publish(user_id, {"type": "unlock", "user_id": user_id, "lock_end_time": end.isoformat()})
+        logger.info("Cleared %d expired locks", len(expired))
+
+    async def _clear_locks(self, user_ids: Optional[List[ObjectId]], now: datetime):
+        """Turn off expired locks (of the given users, or all), stamped with a new change version
+        so delta sync reports the unlock.
+
+        Locks already turned off by another worker are skipped. One read, one $inc for
+        all users, one read of the allocated versions and one bulk write, whatever the
+        number of locks.
+        """
+        from pymongo import UpdateOne
+
+        query = {"lock_mode": True, "lock_end_time": {"$lte": now}}
+        if user_ids is not None:
+            query["user_id"] = {"$in": user_ids}
+        due = await self._db.user_preferences.find(query, {"user_id": 1}).to_list(None)
+        user_ids = [prefs["user_id"] for prefs in due]
+        if not user_ids:
+            return
+        await self._db.users.update_many(
+            {"_id": {"$in": user_ids}},
+            change_version_update(now)
+        )
+        users = await self._db.users.find({"_id": {"$in": user_ids}}, {"change_version": 1}).to_list(None)
+        versions = {user["_id"]: user.get("change_version", 0) for user in users}
+
+        await self._db.user_preferences.bulk_write([
+            UpdateOne(
+                # A lock set again in the meantime is left alone
+                {"user_id": user_id, "lock_mode": True, "lock_end_time": {"$lte": now}},
+                {
+                    "$set": {"lock_mode": False, "lock_end_time": None, "updated_at": now},
+                    "$max": {"version": versions.get(user_id, 0)}
+                }
+            )
+            for user_id in user_ids
+        ], ordered=False)
+
+    async def _watch(self):
+        """Follow lock changes written by any worker"""
+        from pymongo.errors import OperationFailure, PyMongoError
+
+        pipeline = [{"$match": {"$or": [
+            {"operationType": {"$in": ["insert", "replace"]}},
+            {"updateDescription.updatedFields.lock_mode": {"$exists": True}},
+            {"updateDescription.updatedFields.lock_end_time": {"$exists": True}}
+        ]}}]
+        while True:
+            try:
+                async with self._db.user_preferences.watch(
+                    pipeline, full_document="updateLookup", resume_after=self._resume_token
+                ) as stream:
+                    async for change in stream:
+                        self._resume_token = change["_id"]
+                        self._apply_change(change)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as error:
+                if error.code == CHANGE_STREAMS_UNSUPPORTED:
+                    logger.warning("Change streams unavailable, locks from other workers are picked up on resync")
+                    return
+                if error.code == CHANGE_STREAM_HISTORY_LOST:
+                    # Changes missed in between are picked up on the next resync
+                    self._resume_token = None
+                logger.exception("Lock change stream failed, reopening in %ss", LOCK_RETRY_SECONDS)
+                await asyncio.sleep(LOCK_RETRY_SECONDS)
+            except PyMongoError:
+                logger.exception("Lock change stream failed, reopening in %ss", LOCK_RETRY_SECONDS)
+                await asyncio.sleep(LOCK_RETRY_SECONDS)
+
+    def _apply_change(self, change: Dict):
+        """Track a lock change, publishing the unlock when another worker cleared a tracked lock"""
+        prefs = change.get("fullDocument")
+        if not prefs:
+            return
+        user_id = str(prefs["user_id"])
+        end = self._locks.get(user_id)
+        self.update_from_preferences(user_id, prefs)
+        if end is not None and user_id not in self._locks:
+            self._publish(user_id, {"type": "unlock", "user_id": user_id, "lock_end_time": end.isoformat()})
+
+    def _publish(self, user_id: str, event: Dict):
+        for queue in self._subscribers.get(user_id, ()):
+            queue.put_nowait(event)
+
+lock_state = LockStateService()
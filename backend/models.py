@@ -1,27 +1,64 @@
-from pydantic import BaseModel, Field, validator
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field, PlainSerializer, PlainValidator, TypeAdapter, WithJsonSchema
+from typing import Annotated, Any, Dict, Literal, Optional, List, Type, TypeVar
 from datetime import datetime
+from functools import lru_cache
 from bson import ObjectId
 import uuid
 
-class PyObjectId(ObjectId):
-    @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+def validate_object_id(value: Any) -> ObjectId:
+    if isinstance(value, ObjectId):
+        return value
+    if not ObjectId.is_valid(value):
+        raise ValueError("Invalid objectid")
+    return ObjectId(value)
+
+# ObjectId in Python (and in documents sent to MongoDB), string in JSON
+PyObjectId = Annotated[
+    ObjectId,
+    PlainValidator(validate_object_id),
+    PlainSerializer(str, return_type=str, when_used="json"),
+    WithJsonSchema({"type": "string"}),
+]
+
+@lru_cache(maxsize=None)
+def type_adapter(tp: Any) -> TypeAdapter:
+    """TypeAdapter for a type, built once (building one compiles a validator and serializer)"""
+    return TypeAdapter(tp)
+
+# Platforms accepted from clients (the keys of injection_scripts.PLATFORM_SELECTORS)
+Platform = Literal["instagram", "tiktok", "youtube", "facebook"]
+
+# Upper bound for one time-saved event: a full day
+MAX_TIME_SAVED_MINUTES = 24 * 60
+
+MongoModelT = TypeVar("MongoModelT", bound="MongoModel")
+
+class MongoModel(BaseModel):
+    """Base for documents stored in MongoDB"""
+
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
 
     @classmethod
-    def validate(cls, v, validation_info=None):
-        if not ObjectId.is_valid(v):
-            raise ValueError("Invalid objectid")
-        return ObjectId(v)
+    def from_db(cls: Type[MongoModelT], doc: Dict[str, Any]) -> MongoModelT:
+        """Build a model from a document read from our own database.
+
+        Uses the compiled pydantic-core validator: for these models it is faster than
+        the pure-Python model_construct() (see scripts/bench_models).
+        """
+        return cls.model_validate(doc)
 
     @classmethod
-    def __get_pydantic_json_schema__(cls, field_schema):
-        field_schema.update(type="string")
+    def list_from_db(cls: Type[MongoModelT], docs: List[Dict[str, Any]]) -> List[MongoModelT]:
+        """Build models for a batch of documents in one validator call"""
+        return type_adapter(List[cls]).validate_python(docs)
+
+    def to_db(self) -> Dict[str, Any]:
+        """Document to insert, with _id and native ObjectIds"""
+        return self.model_dump(by_alias=True)
 
 # User Models
-class User(BaseModel):
-    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+class User(MongoModel):
+    id: PyObjectId = Field(default_factory=ObjectId, alias="_id")
     name: str
     email: str
     password: str
@@ -30,14 +67,10 @@ class User(BaseModel):
     subscription: str = "free"  # free or premium
     time_saved: int = 0  # minutes
     referral_code: str = Field(default_factory=lambda: str(uuid.uuid4())[:8].upper())
+    change_version: int = 0  # bumped on every change, for delta sync
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
-    class Config:
-        populate_by_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
-
 class UserCreate(BaseModel):
     name: str
     email: str
@@ -59,21 +92,17 @@ class UserResponse(BaseModel):
     created_at: datetime
 
 # Preferences Models
-class UserPreferences(BaseModel):
-    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+class UserPreferences(MongoModel):
+    id: PyObjectId = Field(default_factory=ObjectId, alias="_id")
     user_id: PyObjectId
     hide_reels: bool = True
     hide_stories: bool = False
     hide_suggestions: bool = True
     lock_mode: bool = False
     lock_end_time: Optional[datetime] = None
+    version: int = 0  # user change_version of the last update
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
-    class Config:
-        populate_by_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
-
 class PreferencesUpdate(BaseModel):
     hide_reels: Optional[bool] = None
     hide_stories: Optional[bool] = None
@@ -89,24 +118,37 @@ class PreferencesResponse(BaseModel):
     lock_end_time: Optional[datetime] = None
 
 # Time Session Models
-class TimeSession(BaseModel):
-    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+class TimeSession(MongoModel):
+    id: PyObjectId = Field(default_factory=ObjectId, alias="_id")
     user_id: PyObjectId
     platform: str  # instagram, tiktok, etc.
     time_spent: int  # seconds
     time_saved: int  # estimated minutes saved
     start_time: datetime
     end_time: datetime
+    version: int = 0  # user change_version when recorded
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
-    class Config:
-        populate_by_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+class UsageSession(MongoModel):
+    """Time actually spent on a platform, tracked by heartbeats (see session_tracker.py)"""
+    id: PyObjectId = Field(default_factory=ObjectId, alias="_id")
+    user_id: PyObjectId
+    client_session_id: str
+    platform: str
+    time_spent: int  # seconds of activity
+    start_time: datetime
+    end_time: datetime
+    created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class TimeSavedCreate(BaseModel):
-    minutes: int
-    platform: str = "instagram"
+    minutes: int = Field(gt=0, le=MAX_TIME_SAVED_MINUTES)
+    platform: Platform = "instagram"
+
+class SessionHeartbeat(BaseModel):
+    session_id: str = Field(min_length=1, max_length=64)  # generated by the client per visit
+    platform: Platform = "instagram"
+    elapsed: int = Field(0, ge=0)  # seconds of activity since the previous heartbeat
+    ended: bool = False
 
 # Response Models
 class AuthResponse(BaseModel):
@@ -119,11 +161,67 @@ class StandardResponse(BaseModel):
     success: bool
     message: Optional[str] = None
 
+# Achievement Models
+class Achievement(BaseModel):
+    code: str
+    title: str
+    unlocked_at: datetime
+
 class StatsResponse(BaseModel):
     time_saved: int
     sessions_count: int
     weekly_time_saved: int
     total_sessions: int
+    current_streak: int = 0
+    best_streak: int = 0
+    achievements: List[Achievement] = []
+
+# Sync Models
+class SessionResponse(BaseModel):
+    id: str
+    platform: str
+    time_spent: int
+    time_saved: int
+    start_time: datetime
+    end_time: datetime
+    created_at: datetime
+
+class SyncTotals(BaseModel):
+    time_saved: int
+    total_sessions: int
+    current_streak: int
+    best_streak: int
+
+class SyncResponse(BaseModel):
+    version: int
+    has_more: bool = False
+    preferences: Optional[PreferencesResponse] = None
+    sessions: List[SessionResponse] = []
+    totals: SyncTotals
+
+# Global Stats Models
+class PlatformTotal(BaseModel):
+    platform: str
+    minutes: int
+    hours: float
+    sessions: int
+
+class GlobalStatsResponse(BaseModel):
+    day: str  # UTC day, YYYY-MM-DD
+    total_minutes: int
+    total_hours: float
+    platforms: List[PlatformTotal] = []
+
+# Purge Models
+class PurgeJobResponse(BaseModel):
+    id: str
+    kind: str  # account or retention
+    status: str  # pending, running, done or failed
+    step: Optional[str] = None
+    deleted: Dict[str, int] = {}
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
 
 # Token Model
 class TokenData(BaseModel):
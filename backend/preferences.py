@@ -0,0 +1,33 @@
+from typing import Dict
+from bson import ObjectId
+
+from models import UserPreferences
+from single_flight import single_flight
+
+async def load_preferences(db, user_id: str) -> Dict:
+    """A user's preferences document, created with the defaults on first access.
+
+    Concurrent callers for the same user share one read, and at most one upsert:
+    creating the defaults happens inside the flight, never once per caller.
+    """
+    return await single_flight.do(("preferences", user_id), lambda: _find_or_create(db, ObjectId(user_id)))
+
+async def _find_or_create(db, user_id: ObjectId) -> Dict:
+    from pymongo import ReturnDocument
+    from pymongo.errors import DuplicateKeyError
+
+    prefs = await db.user_preferences.find_one({"user_id": user_id})
+    if prefs:
+        return prefs
+
+    defaults = UserPreferences(user_id=user_id).to_db()
+    try:
+        return await db.user_preferences.find_one_and_update(
+            {"user_id": user_id},
+            {"$setOnInsert": defaults},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Created by another worker between the read and the upsert
+        return await db.user_preferences.find_one({"user_id": user_id})
@@ -0,0 +1,127 @@
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict
+import asyncio
+import hmac
+import json
+import random
+import re
+import sys
+import threading
+import time
+
+from config import get_settings
+from request_context import current_request
+
+PROFILE_HEADER = b"x-debug-profile"
+# Long-lived event streams: a profile would keep its sampler thread for the whole connection
+UNPROFILED_PATHS = frozenset({"/api/user/lock/events"})
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval from a background thread"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Ask the thread to stop, without waiting for it"""
+        self._stop.set()
+
+    def join(self):
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests that carry X-Debug-Profile or are sampled.
+
+    Only installed when PROFILE_DIR is set (see server.py), so it costs nothing otherwise.
+    The sampler watches the event loop thread, so concurrent requests show up in the same
+    profile; DB time comes from the pymongo command listener and is reported separately.
+    Output is one collapsed-stacks file (speedscope / flamegraph.pl) plus a JSON summary,
+    written from the default executor so the event loop never waits on the sampler
+    thread or on disk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        settings = get_settings()
+        self.output_dir = Path(settings.profile_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.token = settings.profile_token.encode() if settings.profile_token else None
+        self.sample_rate = settings.profile_sample_rate
+        self.interval = settings.profile_interval_ms / 1000
+
+    def _should_profile(self, scope) -> bool:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    return hmac.compare_digest(value, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in UNPROFILED_PATHS or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            sampler.stop()
+            summary = self._summary(scope, time.perf_counter() - start, time.thread_time() - cpu_start)
+            await asyncio.get_running_loop().run_in_executor(None, self._write, sampler, summary)
+
+    def _summary(self, scope, wall: float, cpu: float) -> Dict:
+        """Request figures, read on the event loop (the request context is not visible from the executor)"""
+        route = scope.get("route")
+        context = current_request()
+        return {
+            "method": scope["method"],
+            "route": route.path if route is not None else scope["path"],
+            "wall_ms": round(wall * 1000, 2),
+            "loop_thread_cpu_ms": round(cpu * 1000, 2),
+            "db_wait_ms": round(context.db_time_us / 1000, 2) if context else None,
+            "db_round_trips": context.db_round_trips if context else None,
+            "interval_ms": self.interval * 1000,
+        }
+
+    def _write(self, sampler: StackSampler, summary: Dict):
+        sampler.join()
+        name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{summary['method']}{re.sub(r'[^A-Za-z0-9]+', '_', summary['route'])}"
+
+        with open(self.output_dir / f"{name}.collapsed", "w") as collapsed:
+            for stack, count in sampler.stacks.most_common():
+                collapsed.write(f"{stack} {count}\n")
+
+        summary["samples"] = sampler.samples
+        with open(self.output_dir / f"{name}.json", "w") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+
+def profiling_enabled() -> bool:
+    """Whether the profiling middleware should be installed at all"""
+    settings = get_settings()
+    return bool(settings.profile_dir) and (bool(settings.profile_token) or settings.profile_sample_rate > 0)
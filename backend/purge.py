@@ -0,0 +1,295 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from bson import ObjectId
+import asyncio
+import logging
+import os
+import socket
+import time
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Bounds for the adaptive batch size (documents per delete)
+PURGE_MIN_BATCH = 50
+PURGE_MAX_BATCH = 5000
+# A running job whose lease expired (worker crashed or stopped) is picked up again
+PURGE_LEASE_SECONDS = 300
+# Failed jobs are retried this many times before being marked failed
+PURGE_MAX_ATTEMPTS = 5
+# Account deletion order: the users document goes last, so an interrupted job can resume.
+# The final sweep deletes whatever was written by requests already in flight when the account was marked.
+ACCOUNT_STEPS = ("time_sessions", "usage_sessions", "user_achievements", "user_preferences", "users", "sweep")
+# Per-user collections cleared again by the sweep
+SWEPT_COLLECTIONS = ("time_sessions", "usage_sessions", "user_achievements", "user_preferences")
+# Session collections, deleted in batches along their (user_id, created_at) index
+SESSION_COLLECTIONS = ("time_sessions", "usage_sessions")
+
+def account_writes_settle_seconds() -> float:
+    """Delay after which no request can still write data for an account marked for deletion"""
+    settings = get_settings()
+    return (
+        settings.account_status_cache_seconds
+        + settings.request_deadline_ms / 1000
+        + settings.session_idle_seconds
+        + settings.session_checkpoint_seconds
+    )
+
+class PurgeWorker:
+    """Background deletion of user data, from a job queue persisted in purge_jobs.
+
+    Jobs delete sessions in bounded batches, oldest first: along the
+    (user_id, created_at) index for an account, along the created_at index for
+    retention, so only sessions past the cutoff are ever read. The batch size and the pause between batches adapt to the observed
+    delete latency (halved above PURGE_TARGET_LATENCY_MS, grown slowly well below
+    it), and deletes wait for a majority acknowledgement so replication keeps up.
+    Progress is saved on the job after every batch.
+
+    Account jobs only start once no request can write for the account any more:
+    after the account status cache delay (tokens are refused from then on), the
+    longest request deadline and the time for open heartbeat sessions to be closed
+    and written.
+    """
+
+    def __init__(self):
+        self._db = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._retention_day: Optional[str] = None
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.batch_size = 0
+        self.last_latency_ms = 0.0
+        # Kind of the job in progress (its id contains a user id, so it is not exposed)
+        self.current_job_kind: Optional[str] = None
+        self.deleted = Counter()
+
+    async def start(self, db):
+        """Start polling the job queue"""
+        self._db = db
+        self._wakeup = asyncio.Event()
+        self.batch_size = min(max(get_settings().purge_batch_size, PURGE_MIN_BATCH), PURGE_MAX_BATCH)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the worker; a job in progress is resumed from its saved progress later"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def enqueue_account_deletion(self, db, user_id: ObjectId) -> Dict:
+        """Queue the deletion of every document of a user (idempotent)"""
+        from pymongo import ReturnDocument
+
+        now = datetime.utcnow()
+        # Login and authenticated requests are refused from now on, data goes away in the background
+        await db.users.update_one({"_id": user_id}, {"$set": {"deletion_requested_at": now}})
+        job = await db.purge_jobs.find_one_and_update(
+            {"_id": f"account:{user_id}"},
+            {"$setOnInsert": {
+                "kind": "account",
+                "user_id": user_id,
+                "status": "pending",
+                "step": ACCOUNT_STEPS[0],
+                "deleted": {},
+                "attempts": 0,
+                "run_after": now + timedelta(seconds=account_writes_settle_seconds()),
+                "created_at": now,
+                "updated_at": now
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if self._wakeup:
+            self._wakeup.set()
+        return job
+
+    async def get_account_job(self, db, user_id: ObjectId) -> Optional[Dict]:
+        return await db.purge_jobs.find_one({"_id": f"account:{user_id}"})
+
+    def metrics(self) -> Dict:
+        return {
+            "current_job_kind": self.current_job_kind,
+            "batch_size": self.batch_size,
+            "last_latency_ms": round(self.last_latency_ms, 2),
+            "deleted": dict(self.deleted)
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self._schedule_retention()
+                job = await self._claim()
+                # Next job right away, unless this one failed
+                if job and await self._process(job):
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Purge worker iteration failed")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), get_settings().purge_poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _schedule_retention(self):
+        """Queue one retention job per day when RETENTION_DAYS is set (any worker may do it)"""
+        from pymongo.errors import DuplicateKeyError
+
+        retention_days = get_settings().retention_days
+        today = datetime.utcnow().date().isoformat()
+        if not retention_days or self._retention_day == today:
+            return
+
+        now = datetime.utcnow()
+        try:
+            await self._db.purge_jobs.insert_one({
+                "_id": f"retention:{today}",
+                "kind": "retention",
+                "before": now - timedelta(days=retention_days),
+                "status": "pending",
+                "deleted": {},
+                "attempts": 0,
+                "created_at": now,
+                "updated_at": now
+            })
+        except DuplicateKeyError:
+            # Already queued by another worker
+            pass
+        self._retention_day = today
+
+    async def _claim(self) -> Optional[Dict]:
+        """Take the oldest pending job that may start, or a running one whose lease expired"""
+        from pymongo import ReturnDocument
+
+        now = datetime.utcnow()
+        return await self._db.purge_jobs.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "run_after": {"$not": {"$gt": now}}},
+                {"status": "running", "lease_until": {"$lt": now}}
+            ]},
+            {"$set": {
+                "status": "running",
+                "worker": self.worker_id,
+                "lease_until": now + timedelta(seconds=PURGE_LEASE_SECONDS),
+                "updated_at": now
+            }},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _process(self, job: Dict) -> bool:
+        self.current_job_kind = job["kind"]
+        try:
+            if job["kind"] == "account":
+                await self._purge_account(job)
+            else:
+                await self._purge_retention(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            logger.exception("Purge job %s failed", job["_id"])
+            attempts = job.get("attempts", 0) + 1
+            await self._db.purge_jobs.update_one(
+                {"_id": job["_id"]},
+                {"$set": {
+                    "status": "failed" if attempts >= PURGE_MAX_ATTEMPTS else "pending",
+                    "attempts": attempts,
+                    "error": str(error),
+                    "updated_at": datetime.utcnow()
+                }}
+            )
+            return False
+        finally:
+            self.current_job_kind = None
+
+        now = datetime.utcnow()
+        await self._db.purge_jobs.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "done", "finished_at": now, "updated_at": now}, "$unset": {"lease_until": ""}}
+        )
+        logger.info("Purge job %s done: %s", job["_id"], job.get("deleted"))
+        return True
+
+    async def _purge_account(self, job: Dict):
+        user_id = job["user_id"]
+        for step in ACCOUNT_STEPS[ACCOUNT_STEPS.index(job.get("step", ACCOUNT_STEPS[0])):]:
+            await self._save_progress(job, {"step": step})
+            if step in SESSION_COLLECTIONS:
+                await self._purge_sessions(job, step, user_id)
+            elif step == "users":
+                result = await self._db.users.delete_one({"_id": user_id})
+                self.deleted[step] += result.deleted_count
+                await self._save_progress(job, {}, {step: result.deleted_count})
+            elif step == "sweep":
+                for name in SWEPT_COLLECTIONS:
+                    result = await self._db[name].delete_many({"user_id": user_id})
+                    self.deleted[name] += result.deleted_count
+                    await self._save_progress(job, {}, {name: result.deleted_count})
+            else:
+                result = await self._db[step].delete_many({"user_id": user_id})
+                self.deleted[step] += result.deleted_count
+                await self._save_progress(job, {}, {step: result.deleted_count})
+
+    async def _purge_retention(self, job: Dict):
+        """Delete sessions of every user older than the job cutoff"""
+        for name in SESSION_COLLECTIONS:
+            await self._purge_sessions(job, name, before=job["before"])
+
+    async def _purge_sessions(self, job: Dict, name: str, user_id: Optional[ObjectId] = None, before: Optional[datetime] = None):
+        """Delete sessions (of a user, older than `before`) oldest first, in adaptive batches"""
+        from pymongo import WriteConcern
+
+        collection = self._db[name].with_options(write_concern=WriteConcern("majority"))
+        created_at = {"$lt": before} if before else {}
+        while True:
+            query = {"user_id": user_id} if user_id else {}
+            if created_at:
+                query["created_at"] = created_at
+            batch = await self._db[name].find(query, {"created_at": 1}).sort(
+                "created_at", 1
+            ).limit(self.batch_size).to_list(None)
+            if not batch:
+                return
+
+            start = time.perf_counter()
+            result = await collection.delete_many({"_id": {"$in": [session["_id"] for session in batch]}})
+            pause = self._adapt((time.perf_counter() - start) * 1000)
+
+            self.deleted[name] += result.deleted_count
+            await self._save_progress(job, {}, {name: result.deleted_count})
+            # Next batch starts where this one ended, without rescanning deleted index entries
+            created_at = dict(created_at, **{"$gte": batch[-1]["created_at"]})
+            await asyncio.sleep(pause)
+
+    def _adapt(self, latency_ms: float) -> float:
+        """Adjust the batch size to the last delete latency and return the pause before the next one"""
+        target_ms = get_settings().purge_target_latency_ms
+        self.last_latency_ms = latency_ms
+        if latency_ms > target_ms:
+            self.batch_size = max(PURGE_MIN_BATCH, self.batch_size // 2)
+            # Give the database at least as long to recover as the slow batch took
+            return latency_ms * 2 / 1000
+        if latency_ms < target_ms / 2:
+            self.batch_size = min(PURGE_MAX_BATCH, self.batch_size + self.batch_size // 4)
+        return latency_ms / 1000
+
+    async def _save_progress(self, job: Dict, fields: Dict, deleted: Optional[Dict[str, int]] = None):
+        """Persist progress on the job document and extend its lease"""
+        now = datetime.utcnow()
+        update = {"$set": dict(fields, updated_at=now, lease_until=now + timedelta(seconds=PURGE_LEASE_SECONDS))}
+        if deleted:
+            update["$inc"] = {f"deleted.{name}": count for name, count in deleted.items()}
+            for name, count in deleted.items():
+                job.setdefault("deleted", {})[name] = job.get("deleted", {}).get(name, 0) + count
+        job.update(fields)
+        await self._db.purge_jobs.update_one({"_id": job["_id"]}, update)
+
+purge_worker = PurgeWorker()
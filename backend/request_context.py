@@ -0,0 +1,31 @@
+from contextvars import ContextVar
+from typing import Optional
+
+class RequestContext:
+    """Per-request state shared between middleware, dependencies and DB hooks.
+
+    Motor runs pymongo calls in a thread pool with a copy of the current context,
+    so the object itself is mutated rather than the ContextVar being re-set.
+    """
+
+    __slots__ = ("user_id", "db_round_trips", "db_time_us", "failed_command")
+
+    def __init__(self):
+        self.user_id: Optional[str] = None
+        self.db_round_trips: int = 0
+        # Server-side duration of this request's DB commands, as reported by pymongo
+        self.db_time_us: int = 0
+        # Name of the last DB command that failed (e.g. "find"), used to attribute timeouts
+        self.failed_command: Optional[str] = None
+
+_current_request: ContextVar[Optional[RequestContext]] = ContextVar("current_request", default=None)
+
+def start_request() -> RequestContext:
+    """Attach a fresh context to the current request"""
+    context = RequestContext()
+    _current_request.set(context)
+    return context
+
+def current_request() -> Optional[RequestContext]:
+    """Context of the request being handled, None outside a request"""
+    return _current_request.get()
@@ -3,8 +3,8 @@ from fastapi.security import HTTPAuthorizationCredentials
 from models import User, UserCreate, UserLogin, AuthResponse, UserResponse, UserPreferences
 from auth import get_password_hash, verify_password, create_access_token, get_current_user_id
 from database import get_database
+from single_flight import single_flight
 from bson import ObjectId
-from datetime import datetime
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
@@ -31,32 +31,20 @@ async def register(user_data: UserCreate):
     )
     
     # Insert user
-    result = await db.users.insert_one(user.dict(by_alias=True))
+    result = await db.users.insert_one(user.to_db())
     user_id = str(result.inserted_id)
     
     # Create default preferences
     preferences = UserPreferences(user_id=ObjectId(user_id))
-    await db.user_preferences.insert_one(preferences.dict(by_alias=True))
+    await db.user_preferences.insert_one(preferences.to_db())
     
     # Generate token
     token = create_access_token(data={"sub": user_id})
     
     # Return user response
-    user_response = UserResponse(
-        id=user_id,
-        name=user.name,
-        email=user.email,
-        avatar=user.avatar,
-        bio=user.bio,
-        subscription=user.subscription,
-        time_saved=user.time_saved,
-        referral_code=user.referral_code,
-        created_at=user.created_at
-    )
-    
     return AuthResponse(
         success=True,
-        user=user_response,
+        user=_user_response(user),
         token=token
     )
 
@@ -67,7 +55,8 @@ async def login(login_data: UserLogin):
     
     # Find user
     user_doc = await db.users.find_one({"email": login_data.email})
-    if not user_doc or not verify_password(login_data.password, user_doc["password"]):
+    # Accounts being deleted can no longer log in
+    if not user_doc or user_doc.get("deletion_requested_at") or not verify_password(login_data.password, user_doc["password"]):
         return AuthResponse(
             success=False,
             message="Email ou mot de passe incorrect"
@@ -77,21 +66,9 @@ async def login(login_data: UserLogin):
     token = create_access_token(data={"sub": str(user_doc["_id"])})
     
     # Return user response
-    user_response = UserResponse(
-        id=str(user_doc["_id"]),
-        name=user_doc["name"],
-        email=user_doc["email"],
-        avatar=user_doc.get("avatar"),
-        bio=user_doc.get("bio"),
-        subscription=user_doc.get("subscription", "free"),
-        time_saved=user_doc.get("time_saved", 0),
-        referral_code=user_doc.get("referral_code", ""),
-        created_at=user_doc.get("created_at", datetime.utcnow())
-    )
-    
     return AuthResponse(
         success=True,
-        user=user_response,
+        user=_user_response(User.from_db(user_doc)),
         token=token
     )
 
@@ -100,21 +77,29 @@ async def get_current_user(current_user_id: str = Depends(get_current_user_id)):
     """Get current user info"""
     db = await get_database()
     
-    user_doc = await db.users.find_one({"_id": ObjectId(current_user_id)})
+    # Concurrent /me requests for the same user share one query
+    user_doc = await single_flight.do(
+        ("user", current_user_id),
+        lambda: db.users.find_one({"_id": ObjectId(current_user_id)})
+    )
     if not user_doc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Utilisateur non trouvé"
         )
     
+    return _user_response(User.from_db(user_doc))
+
+def _user_response(user: User) -> UserResponse:
+    """Public view of a user"""
     return UserResponse(
-        id=str(user_doc["_id"]),
-        name=user_doc["name"],
-        email=user_doc["email"],
-        avatar=user_doc.get("avatar"),
-        bio=user_doc.get("bio"),
-        subscription=user_doc.get("subscription", "free"),
-        time_saved=user_doc.get("time_saved", 0),
-        referral_code=user_doc.get("referral_code", ""),
-        created_at=user_doc.get("created_at", datetime.utcnow())
+        id=str(user.id),
+        name=user.name,
+        email=user.email,
+        avatar=user.avatar,
+        bio=user.bio,
+        subscription=user.subscription,
+        time_saved=user.time_saved,
+        referral_code=user.referral_code,
+        created_at=user.created_at
     )
\ No newline at end of file
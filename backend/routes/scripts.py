@@ -0,0 +1,58 @@
+from fastapi import APIRouter, HTTPException, status, Depends, Request
+from fastapi.responses import Response
+from auth import get_current_user_id
+from database import get_database
+from preferences import load_preferences
+from injection_scripts import PLATFORM_SELECTORS, ScriptVariant, variant_for, variant_by_digest
+
+JAVASCRIPT_MEDIA_TYPE = "application/javascript"
+
+router = APIRouter(prefix="/scripts", tags=["scripts"])
+
+def _not_modified(request: Request, variant: ScriptVariant) -> bool:
+    """Whether If-None-Match already names this variant"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or variant.etag in tags
+
+def _script_response(request: Request, variant: ScriptVariant, cache_control: str) -> Response:
+    headers = {"etag": variant.etag, "cache-control": cache_control, "content-location": variant.url}
+    if _not_modified(request, variant):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=variant.body, media_type=JAVASCRIPT_MEDIA_TYPE, headers=headers)
+
+@router.get("/{platform}")
+async def get_script(
+    platform: str,
+    request: Request,
+    current_user_id: str = Depends(get_current_user_id)
+):
+    """Injection script for the current user's preferences (revalidated with the ETag)"""
+    if platform not in PLATFORM_SELECTORS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Plateforme non prise en charge"
+        )
+    
+    db = await get_database()
+    
+    # Concurrent loads for the same user share one query
+    prefs = await load_preferences(db, current_user_id)
+    variant = variant_for(platform, prefs)
+    
+    # Preferences can change at any time: cache, but check the ETag on every load
+    return _script_response(request, variant, "private, no-cache")
+
+@router.get("/{platform}/{digest}.js")
+async def get_script_by_hash(platform: str, digest: str, request: Request):
+    """Injection script by content hash, cacheable forever"""
+    variant = variant_by_digest(platform, digest)
+    if variant is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Script non trouvé"
+        )
+    
+    return _script_response(request, variant, "public, max-age=31536000, immutable")
@@ -0,0 +1,34 @@
+from fastapi import APIRouter
+from models import GlobalStatsResponse, PlatformTotal
+from database import get_database
+from global_counters import global_counters
+from datetime import datetime
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+@router.get("/global", response_model=GlobalStatsResponse)
+async def get_global_stats():
+    """Time saved today by all users, per platform"""
+    db = await get_database()
+    
+    # Summed from sharded counters, cached for a few seconds
+    day = datetime.utcnow().date().isoformat()
+    totals = await global_counters.totals(db, day)
+    
+    platforms = [
+        PlatformTotal(
+            platform=platform,
+            minutes=counts["minutes"],
+            hours=round(counts["minutes"] / 60, 1),
+            sessions=counts["sessions"]
+        )
+        for platform, counts in sorted(totals.items(), key=lambda item: -item[1]["minutes"])
+    ]
+    total_minutes = sum(platform.minutes for platform in platforms)
+    
+    return GlobalStatsResponse(
+        day=day,
+        total_minutes=total_minutes,
+        total_hours=round(total_minutes / 60, 1),
+        platforms=platforms
+    )
@@ -1,39 +1,78 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from models import PreferencesUpdate, PreferencesResponse, TimeSavedCreate, StatsResponse, StandardResponse
-from auth import get_current_user_id
-from database import get_database
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+from models import (
+    PreferencesUpdate, PreferencesResponse, TimeSavedCreate, StatsResponse, StandardResponse,
+    SessionResponse, SyncTotals, SyncResponse, UserPreferences, TimeSession, SessionHeartbeat,
+    PurgeJobResponse
+)
+from auth import get_current_user_id, verify_token, account_status
+from database import get_database, next_change_version, change_version_update, unsettled_versions
+from lock_state import lock_state
+from session_tracker import session_tracker
+from purge import purge_worker
+from global_counters import global_counters
+from single_flight import single_flight
+from idempotency import idempotency_store
+from access_log import hash_user_id
+from content_negotiation import negotiate_format, NegotiatedResponse
+from preferences import load_preferences
+from achievements import record_time_saved, get_achievements_state, current_streak, achievements_list
 from bson import ObjectId
 from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import json
+import logging
 
-router = APIRouter(prefix="/user", tags=["user"])
+# Seconds between keep-alive comments on the lock events stream
+LOCK_EVENTS_KEEPALIVE_SECONDS = 15
+# Maximum sessions returned by one sync response
+SYNC_MAX_SESSIONS = 500
+# Idempotency keys remembered on the user document by time-saved writes
+APPLIED_KEYS_KEPT = 20
+
+logger = logging.getLogger(__name__)
+
+# Responses are JSON, or MessagePack when requested with Accept: application/msgpack
+router = APIRouter(
+    prefix="/user",
+    tags=["user"],
+    dependencies=[Depends(negotiate_format)],
+    default_response_class=NegotiatedResponse
+)
+
+def _preferences_response(prefs: dict) -> PreferencesResponse:
+    """Public view of a preferences document"""
+    preferences = UserPreferences.from_db(prefs)
+    return PreferencesResponse(
+        hide_reels=preferences.hide_reels,
+        hide_stories=preferences.hide_stories,
+        hide_suggestions=preferences.hide_suggestions,
+        lock_mode=preferences.lock_mode,
+        lock_end_time=preferences.lock_end_time
+    )
+
+def _session_response(session: TimeSession) -> SessionResponse:
+    """Public view of a time session"""
+    return SessionResponse(
+        id=str(session.id),
+        platform=session.platform,
+        time_spent=session.time_spent,
+        time_saved=session.time_saved,
+        start_time=session.start_time,
+        end_time=session.end_time,
+        created_at=session.created_at
+    )
 
 @router.get("/preferences", response_model=PreferencesResponse)
 async def get_preferences(current_user_id: str = Depends(get_current_user_id)):
     """Get user preferences"""
     db = await get_database()
     
-    prefs = await db.user_preferences.find_one({"user_id": ObjectId(current_user_id)})
-    if not prefs:
-        # Create default preferences if not exist
-        default_prefs = {
-            "user_id": ObjectId(current_user_id),
-            "hide_reels": True,
-            "hide_stories": False,
-            "hide_suggestions": True,
-            "lock_mode": False,
-            "lock_end_time": None,
-            "updated_at": datetime.utcnow()
-        }
-        await db.user_preferences.insert_one(default_prefs)
-        prefs = default_prefs
+    # Concurrent reads for the same user share one query, defaults are created on first access
+    prefs = await load_preferences(db, current_user_id)
     
-    return PreferencesResponse(
-        hide_reels=prefs.get("hide_reels", True),
-        hide_stories=prefs.get("hide_stories", False),
-        hide_suggestions=prefs.get("hide_suggestions", True),
-        lock_mode=prefs.get("lock_mode", False),
-        lock_end_time=prefs.get("lock_end_time")
-    )
+    return _preferences_response(prefs)
 
 @router.put("/preferences", response_model=PreferencesResponse)
 async def update_preferences(
@@ -43,17 +82,17 @@ async def update_preferences(
     """Update user preferences"""
     db = await get_database()
     
-    # Check if lock mode is active
-    current_prefs = await db.user_preferences.find_one({"user_id": ObjectId(current_user_id)})
-    if current_prefs and current_prefs.get("lock_mode") and current_prefs.get("lock_end_time"):
-        if datetime.utcnow() < current_prefs["lock_end_time"]:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Mode verrou actif - impossible de modifier les réglages"
-            )
+    # Check if lock mode is active (in-memory, no DB read)
+    locked_exception = HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Mode verrou actif - impossible de modifier les réglages"
+    )
+    if lock_state.is_locked(current_user_id):
+        raise locked_exception
     
     # Prepare update data
-    update_data = {"updated_at": datetime.utcnow()}
+    now = datetime.utcnow()
+    update_data = {"updated_at": now}
     if preferences.hide_reels is not None:
         update_data["hide_reels"] = preferences.hide_reels
     if preferences.hide_stories is not None:
@@ -65,91 +104,342 @@ async def update_preferences(
     if preferences.lock_end_time is not None:
         update_data["lock_end_time"] = preferences.lock_end_time
     
-    # Update preferences
-    await db.user_preferences.update_one(
-        {"user_id": ObjectId(current_user_id)},
-        {"$set": update_data},
-        upsert=True
-    )
+    # Update preferences, the filter also rejects locks set through another worker
+    from pymongo import ReturnDocument
+    from pymongo.errors import DuplicateKeyError
+    try:
+        updated_prefs = await db.user_preferences.find_one_and_update(
+            {
+                "user_id": ObjectId(current_user_id),
+                "$or": [
+                    {"lock_mode": {"$ne": True}},
+                    {"lock_end_time": None},
+                    {"lock_end_time": {"$lte": now}}
+                ]
+            },
+            {"$set": update_data},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Document exists but did not match: lock is active
+        raise locked_exception
     
-    # Return updated preferences
-    updated_prefs = await db.user_preferences.find_one({"user_id": ObjectId(current_user_id)})
-    return PreferencesResponse(
-        hide_reels=updated_prefs.get("hide_reels", True),
-        hide_stories=updated_prefs.get("hide_stories", False),
-        hide_suggestions=updated_prefs.get("hide_suggestions", True),
-        lock_mode=updated_prefs.get("lock_mode", False),
-        lock_end_time=updated_prefs.get("lock_end_time")
-    )
+    # Stamp the change for delta sync, only once it is applied ($max: concurrent updates may finish out of order)
+    version = await next_change_version(db, ObjectId(current_user_id))
+    await db.user_preferences.update_one({"_id": updated_prefs["_id"]}, {"$max": {"version": version}})
+    updated_prefs["version"] = max(updated_prefs.get("version", 0), version)
+    
+    lock_state.update_from_preferences(current_user_id, updated_prefs)
+    
+    return _preferences_response(updated_prefs)
+
+@router.get("/lock/events")
+async def lock_events(current_user_id: str = Depends(get_current_user_id)):
+    """Stream unlock events for the current user (Server-Sent Events)"""
+    # The lock may have been set through another worker that this one has not heard of yet
+    await lock_state.refresh(current_user_id)
+    
+    async def event_stream():
+        queue = lock_state.subscribe(current_user_id)
+        try:
+            end = lock_state.lock_end_time(current_user_id)
+            yield f"event: state\ndata: {json.dumps({'locked': end is not None, 'lock_end_time': end.isoformat() if end else None})}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), LOCK_EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            lock_state.unsubscribe(current_user_id, queue)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 @router.post("/time-saved", response_model=dict)
 async def add_time_saved(
     time_data: TimeSavedCreate,
-    current_user_id: str = Depends(get_current_user_id)
+    current_user_id: str = Depends(get_current_user_id),
+    idempotency_key: Optional[str] = Header(None)
 ):
     """Add time saved for user"""
     db = await get_database()
     
-    # Update user's total time saved
-    result = await db.users.update_one(
-        {"_id": ObjectId(current_user_id)},
-        {"$inc": {"time_saved": time_data.minutes}}
+    if not idempotency_key:
+        return await _add_time_saved(db, current_user_id, time_data)
+    
+    # Retries with the same Idempotency-Key get the original response without new writes
+    fingerprint = idempotency_store.fingerprint(time_data.model_dump())
+    previous_response = await idempotency_store.begin(db, current_user_id, idempotency_key, fingerprint)
+    if previous_response is not None:
+        return previous_response
+    
+    async def remember(response):
+        # Stored as soon as the total is updated: from then on retries replay it
+        await idempotency_store.complete(db, current_user_id, idempotency_key, fingerprint, response)
+    
+    try:
+        return await _add_time_saved(db, current_user_id, time_data, idempotency_key, remember)
+    except HTTPException:
+        # Only raised before any write (unknown user), the key can be used again
+        await idempotency_store.abort(db, current_user_id, idempotency_key)
+        raise
+    # Other failures may come after the total was updated: the reservation is kept until
+    # its lease expires, and the applied_keys guard stops the retry from adding the time again
+
+async def _add_time_saved(
+    db,
+    current_user_id: str,
+    time_data: TimeSavedCreate,
+    idempotency_key: Optional[str] = None,
+    on_applied: Optional[Callable[[Dict], Awaitable[None]]] = None
+):
+    """Writes behind add_time_saved.
+    
+    Only the total update has to succeed: once it is applied the response is final.
+    The session record, achievements and global counters are written afterwards on a
+    best-effort basis (failures are logged; achievements can be rebuilt with
+    scripts.replay_achievements).
+    """
+    from pymongo import ReturnDocument
+    
+    user_id = ObjectId(current_user_id)
+    
+    # Update user's total time saved and bump the change version in one round trip
+    user_filter = {"_id": user_id}
+    update = change_version_update(datetime.utcnow())
+    update["$inc"]["time_saved"] = time_data.minutes
+    if idempotency_key:
+        # The key is recorded by the same write, so a retry can never apply it twice
+        user_filter["applied_keys"] = {"$ne": idempotency_key}
+        update["$push"]["applied_keys"] = {"$each": [idempotency_key], "$slice": -APPLIED_KEYS_KEPT}
+    user = await db.users.find_one_and_update(
+        user_filter,
+        update,
+        projection={"time_saved": 1, "change_version": 1},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.modified_count == 0:
+    if not user and idempotency_key:
+        # Applied by an earlier attempt that failed before storing its response
+        user = await db.users.find_one({"_id": user_id, "applied_keys": idempotency_key}, {"time_saved": 1})
+        if user:
+            response = {"success": True, "total_time_saved": user.get("time_saved", 0)}
+            await on_applied(response)
+            return response
+    
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Utilisateur non trouvé"
         )
     
-    # Create time session record
-    session_data = {
-        "user_id": ObjectId(current_user_id),
-        "platform": time_data.platform,
-        "time_spent": 0,  # Will be updated later
-        "time_saved": time_data.minutes,
-        "start_time": datetime.utcnow(),
-        "end_time": datetime.utcnow(),
-        "created_at": datetime.utcnow()
-    }
-    await db.time_sessions.insert_one(session_data)
-    
-    # Get updated total
-    user = await db.users.find_one({"_id": ObjectId(current_user_id)})
-    
-    return {
+    response = {
         "success": True,
         "total_time_saved": user.get("time_saved", 0)
     }
+    if on_applied:
+        await on_applied(response)
+    
+    try:
+        # Create time session record
+        now = datetime.utcnow()
+        session_data = {
+            "user_id": user_id,
+            "platform": time_data.platform,
+            "time_spent": 0,  # Will be updated later
+            "time_saved": time_data.minutes,
+            "start_time": now,
+            "end_time": now,
+            "version": user["change_version"],
+            "created_at": now
+        }
+        await db.time_sessions.insert_one(session_data)
+        
+        # Update streaks and milestones incrementally
+        await record_time_saved(db, user_id, time_data.minutes, session_data["created_at"])
+        
+        # Platform-wide total for today (sharded, see global_counters.py)
+        await global_counters.add(db, time_data.platform, time_data.minutes, session_data["created_at"])
+    except Exception:
+        logger.exception("Time saved recorded for user %s, but a follow-up write failed", hash_user_id(current_user_id))
+    
+    return response
+
+@router.post("/sessions/heartbeat", response_model=StandardResponse)
+async def session_heartbeat(
+    heartbeat: SessionHeartbeat,
+    current_user_id: str = Depends(get_current_user_id)
+):
+    """Record activity on an open session (written on close or periodic checkpoint)"""
+    if session_tracker.heartbeat(current_user_id, heartbeat.session_id, heartbeat.platform, heartbeat.elapsed) is None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Trop de sessions ouvertes"
+        )
+    if heartbeat.ended:
+        await session_tracker.close(current_user_id, heartbeat.session_id)
+    
+    return StandardResponse(success=True)
+
+@router.get("/sync", response_model=SyncResponse)
+async def sync_changes(
+    since: int = Query(0, ge=0),
+    current_user_id: str = Depends(get_current_user_id)
+):
+    """Return what changed since the given change version in one payload.
+    
+    A write allocates its version before stamping the document, and concurrent writes
+    may finish out of order. The returned version is the highest one below every
+    version that is recent (allocated less than the request deadline ago) and not
+    found on any entity yet, so the next sync cannot skip a write still in flight.
+    Entities stamped exactly at `since` are always sent again.
+    
+    When `has_more` is set, the same applies to the last session of the page.
+    """
+    db = await get_database()
+    user_id = ObjectId(current_user_id)
+    
+    user = await db.users.find_one({"_id": user_id}, {"time_saved": 1, "change_version": 1, "change_version_times": 1})
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Utilisateur non trouvé"
+        )
+    version = user.get("change_version", 0)
+    
+    # Preferences only if they changed (always on a full sync)
+    prefs_filter = {"user_id": user_id}
+    if since:
+        prefs_filter["version"] = {"$gte": since}
+    prefs = await db.user_preferences.find_one(prefs_filter)
+    
+    # New sessions in version order, bounded per response
+    # (sessions recorded before change versions existed are not part of sync)
+    sessions = await db.time_sessions.find(
+        {"user_id": user_id, "version": {"$gte": since}}
+    ).sort("version", 1).limit(SYNC_MAX_SESSIONS + 1).to_list(None)
+    has_more = len(sessions) > SYNC_MAX_SESSIONS
+    if has_more:
+        sessions = sessions[:SYNC_MAX_SESSIONS]
+        # Resume from the last session sent
+        version = sessions[-1]["version"]
+    
+    # Recent versions not found on any entity may belong to writes still in flight
+    stamped = {session["version"] for session in sessions}
+    if prefs:
+        stamped.add(prefs.get("version"))
+    unsettled = [
+        unsettled_version for unsettled_version in unsettled_versions(user)
+        if since < unsettled_version <= version and unsettled_version not in stamped
+    ]
+    if unsettled:
+        version = min(unsettled) - 1
+    
+    achievements_state = await get_achievements_state(db, user_id)
+    
+    return SyncResponse(
+        version=version,
+        has_more=has_more,
+        preferences=_preferences_response(prefs) if prefs else None,
+        sessions=[
+            _session_response(session)
+            for session in TimeSession.list_from_db(sessions)
+        ],
+        totals=SyncTotals(
+            time_saved=user.get("time_saved", 0),
+            total_sessions=(achievements_state or {}).get("total_sessions", 0),
+            current_streak=current_streak(achievements_state),
+            best_streak=(achievements_state or {}).get("best_streak", 0)
+        )
+    )
 
 @router.get("/stats", response_model=StatsResponse)
 async def get_user_stats(current_user_id: str = Depends(get_current_user_id)):
     """Get user statistics"""
     db = await get_database()
     
-    # Get user
-    user = await db.users.find_one({"_id": ObjectId(current_user_id)})
+    # Concurrent stats requests for the same user share one set of reads
+    user, total_sessions, weekly_sessions, achievements_state = await single_flight.do(
+        ("stats", current_user_id),
+        lambda: _load_stats(db, ObjectId(current_user_id))
+    )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Utilisateur non trouvé"
         )
     
-    # Get total sessions count
-    total_sessions = await db.time_sessions.count_documents({"user_id": ObjectId(current_user_id)})
-    
-    # Get weekly stats (last 7 days)
-    week_ago = datetime.utcnow() - timedelta(days=7)
-    weekly_sessions = await db.time_sessions.find({
-        "user_id": ObjectId(current_user_id),
-        "created_at": {"$gte": week_ago}
-    }).to_list(None)
-    
     weekly_time_saved = sum(session.get("time_saved", 0) for session in weekly_sessions)
     
     return StatsResponse(
         time_saved=user.get("time_saved", 0),
         sessions_count=len(weekly_sessions),
         weekly_time_saved=weekly_time_saved,
-        total_sessions=total_sessions
-    )
\ No newline at end of file
+        total_sessions=total_sessions,
+        current_streak=current_streak(achievements_state),
+        best_streak=(achievements_state or {}).get("best_streak", 0),
+        achievements=achievements_list(achievements_state)
+    )
+
+async def _load_stats(db, user_id: ObjectId):
+    """Reads behind get_user_stats: user, session count, last 7 days, achievements"""
+    # Get user
+    user = await db.users.find_one({"_id": user_id})
+    if not user:
+        return None, 0, [], None
+    
+    # Get total sessions count
+    total_sessions = await db.time_sessions.count_documents({"user_id": user_id})
+    
+    # Get weekly stats (last 7 days)
+    week_ago = datetime.utcnow() - timedelta(days=7)
+    weekly_sessions = await db.time_sessions.find(
+        {"user_id": user_id, "created_at": {"$gte": week_ago}},
+        {"time_saved": 1}
+    ).to_list(None)
+    
+    # Achievements are maintained on write, a single document read here
+    achievements_state = await get_achievements_state(db, user_id)
+    
+    return user, total_sessions, weekly_sessions, achievements_state
+
+def _purge_job_response(job: dict) -> PurgeJobResponse:
+    """Public view of a purge job"""
+    return PurgeJobResponse(
+        id=job["_id"],
+        kind=job["kind"],
+        status=job["status"],
+        step=job.get("step"),
+        deleted=job.get("deleted", {}),
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+        finished_at=job.get("finished_at")
+    )
+
+@router.delete("/account", response_model=PurgeJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def delete_account(current_user_id: str = Depends(get_current_user_id)):
+    """Queue the deletion of the account and all its data"""
+    db = await get_database()
+    
+    # Deleted in throttled batches by the purge worker, progress at GET /user/account/deletion
+    job = await purge_worker.enqueue_account_deletion(db, ObjectId(current_user_id))
+    # Other requests with this token are refused from now on (other workers within the status cache delay)
+    account_status.deactivate(current_user_id)
+    
+    return _purge_job_response(job)
+
+@router.get("/account/deletion", response_model=PurgeJobResponse)
+async def get_account_deletion(current_user_id: str = Depends(verify_token)):
+    """Progress of the account deletion (token only: the account itself is refused everywhere else)"""
+    db = await get_database()
+    
+    job = await purge_worker.get_account_job(db, ObjectId(current_user_id))
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Aucune suppression de compte en cours"
+        )
+    
+    return _purge_job_response(job)
@@ -0,0 +1,80 @@
+"""
+Bytes on the wire and encode CPU per response format.
+
+Usage (from the backend directory):
+    python -m scripts.bench_encodings [--sessions 500] [--repeat 200]
+
+Encodes a representative /api/user/sync payload as JSON and MessagePack, then
+compresses each with every encoder available in this install.
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from compression import available_encoders
+from content_negotiation import get_msgpack
+
+def sample_payload(session_count: int):
+    """A sync response as FastAPI hands it to the response class (JSON-compatible)"""
+    now = datetime(2026, 1, 1)
+    return {
+        "version": session_count,
+        "has_more": False,
+        "preferences": {
+            "hide_reels": True,
+            "hide_stories": False,
+            "hide_suggestions": True,
+            "lock_mode": False,
+            "lock_end_time": None,
+        },
+        "sessions": [
+            {
+                "id": f"{index:024x}",
+                "platform": ("instagram", "tiktok", "youtube")[index % 3],
+                "time_spent": (index * 37) % 1800,
+                "time_saved": (index * 7) % 60,
+                "start_time": (now + timedelta(minutes=index * 90)).isoformat(),
+                "end_time": (now + timedelta(minutes=index * 90 + 15)).isoformat(),
+                "created_at": (now + timedelta(minutes=index * 90 + 15)).isoformat(),
+            }
+            for index in range(session_count)
+        ],
+        "totals": {"time_saved": 4200, "total_sessions": session_count, "current_streak": 4, "best_streak": 12},
+    }
+
+def measure(fn, repeat: int):
+    """(result, microseconds per call)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark response encodings")
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    payload = sample_payload(args.sessions)
+    formats = {
+        # Same settings as starlette's JSONResponse.render
+        "json": lambda: json.dumps(payload, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8"),
+    }
+    msgpack = get_msgpack()
+    if msgpack:
+        formats["msgpack"] = lambda: msgpack.packb(payload, use_bin_type=True)
+    else:
+        print("msgpack not installed, skipping")
+
+    print(f"{'format':<16}{'bytes':>10}{'encode us':>12}{'compress us':>14}{'total us':>12}")
+    for name, encode in formats.items():
+        body, encode_us = measure(encode, args.repeat)
+        print(f"{name:<16}{len(body):>10}{encode_us:>12.1f}{0:>14.1f}{encode_us:>12.1f}")
+        for encoding, make_encoder in available_encoders().items():
+            compressed, compress_us = measure(lambda: make_encoder().finish(body), args.repeat)
+            print(f"{name + '+' + encoding:<16}{len(compressed):>10}{encode_us:>12.1f}{compress_us:>14.1f}{encode_us + compress_us:>12.1f}")
+
+if __name__ == "__main__":
+    main()
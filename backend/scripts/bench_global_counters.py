@@ -0,0 +1,71 @@
+"""
+Write throughput of the sharded global counters against the shard count.
+
+Usage (from the backend directory, needs a running MongoDB):
+    python -m scripts.bench_global_counters [--shards 1 4 16 64] [--writers 64] [--seconds 5]
+
+Every writer increments the counter of the same platform and day as fast as it can,
+the worst case for a single counter document. Runs against a scratch database
+(icare_bench by default) that is dropped at the end.
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from config import get_settings
+from global_counters import GlobalCounters
+
+async def run(db, counters: GlobalCounters, shards: int, writers: int, seconds: float):
+    """Writes per second, and p99 write latency in ms"""
+    await db.global_counters.delete_many({})
+    deadline = time.perf_counter() + seconds
+    latencies = []
+    at = datetime.utcnow()
+
+    async def writer():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await counters.add(db, "instagram", 1, at, shards=shards)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer() for _ in range(writers)))
+    elapsed = time.perf_counter() - start
+
+    # Reads must see every write, whatever the shard count
+    total = (await counters._sum_shards(db, at.date().isoformat())).get("instagram", {}).get("sessions", 0)
+    assert total == len(latencies), f"lost writes: {total} counted, {len(latencies)} written"
+
+    latencies.sort()
+    return len(latencies) / elapsed, latencies[int(len(latencies) * 0.99)] * 1000
+
+async def bench(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(get_settings().mongo_url, maxPoolSize=args.writers)
+    db = client[args.db]
+    counters = GlobalCounters()
+    try:
+        print(f"{'shards':>8}{'writes/s':>12}{'p99 ms':>10}")
+        for shards in args.shards:
+            throughput, p99 = await run(db, counters, shards, args.writers, args.seconds)
+            print(f"{shards:>8}{throughput:>12,.0f}{p99:>10.2f}")
+    finally:
+        await client.drop_database(args.db)
+        client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sharded counter writes")
+    parser.add_argument("--db", default="icare_bench", help="Scratch database, dropped afterwards")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--writers", type=int, default=64, help="Concurrent writers")
+    parser.add_argument("--seconds", type=float, default=5, help="Duration per shard count")
+    args = parser.parse_args()
+    if args.db == get_settings().db_name:
+        raise SystemExit(f"Refusing to benchmark against the application database {args.db!r}")
+    asyncio.run(bench(args))
+
+if __name__ == "__main__":
+    main()
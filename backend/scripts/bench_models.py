@@ -0,0 +1,71 @@
+"""
+(De)serialization microbenchmarks for the MongoDB models.
+
+Usage (from the backend directory):
+    python -m scripts.bench_models [--repeat 20000]
+
+Compares the ways of building models from DB documents (from_db, which uses the
+compiled validator, against the pure-Python model_construct), batch construction
+through a cached TypeAdapter, and the dump paths used for inserts (to_db) and
+responses (JSON).
+"""
+
+import argparse
+import time
+from datetime import datetime
+from bson import ObjectId
+
+from models import User, UserPreferences, TimeSession
+
+def documents():
+    """One DB document per model, as motor returns them"""
+    now = datetime.utcnow()
+    user_id = ObjectId()
+    return {
+        User: {
+            "_id": user_id, "name": "Marie Dubois", "email": "marie@example.com",
+            "password": "$2b$12$" + "x" * 53, "avatar": None,
+            "bio": "Reprendre le contrôle de mon temps sur les réseaux sociaux 🎯",
+            "subscription": "free", "time_saved": 420, "referral_code": "AB12CD34",
+            "change_version": 12, "created_at": now, "updated_at": now,
+        },
+        UserPreferences: {
+            "_id": ObjectId(), "user_id": user_id, "hide_reels": True, "hide_stories": False,
+            "hide_suggestions": True, "lock_mode": False, "lock_end_time": None,
+            "version": 3, "updated_at": now,
+        },
+        TimeSession: {
+            "_id": ObjectId(), "user_id": user_id, "platform": "instagram", "time_spent": 0,
+            "time_saved": 15, "start_time": now, "end_time": now, "version": 12, "created_at": now,
+        },
+    }
+
+def per_call_us(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark model (de)serialization")
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'model':<16}{'operation':<34}{'us/call':>10}")
+    for model, doc in documents().items():
+        instance = model.model_validate(doc)
+        docs = [doc] * 100
+        cases = [
+            ("from_db(doc)", lambda: model.from_db(doc)),
+            ("model_construct(**doc)", lambda: model.model_construct(**doc)),
+            ("to_db()", lambda: instance.to_db()),
+            ("model_dump_json()", lambda: instance.model_dump_json()),
+            ("list_from_db x100", lambda: model.list_from_db(docs)),
+            ("from_db x100", lambda: [model.from_db(item) for item in docs]),
+            ("model_construct x100", lambda: [model.model_construct(**item) for item in docs]),
+        ]
+        for name, fn in cases:
+            print(f"{model.__name__:<16}{name:<34}{per_call_us(fn, args.repeat if 'x100' not in name else args.repeat // 100):>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Rebuild achievements state from time_sessions history.
+
+Usage (from the backend directory):
+    python -m scripts.replay_achievements              # every user
+    python -m scripts.replay_achievements --user-id <id>
+"""
+
+import argparse
+import asyncio
+from bson import ObjectId
+from database import connect_to_mongo, close_mongo_connection, get_database
+from achievements import rebuild_achievements
+
+async def replay(user_id=None):
+    await connect_to_mongo()
+    try:
+        db = await get_database()
+        if user_id:
+            query = {"_id": ObjectId(user_id)}
+        else:
+            query = {}
+
+        count = 0
+        async for user in db.users.find(query, {"_id": 1}):
+            state = await rebuild_achievements(db, user["_id"])
+            count += 1
+            print(f"[{count}] {user['_id']}: {state['total_sessions']} sessions, "
+                  f"best streak {state['best_streak']}, {len(state['unlocked'])} achievements")
+    finally:
+        await close_mongo_connection()
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild achievements state from time_sessions")
+    parser.add_argument("--user-id", help="Only rebuild this user")
+    args = parser.parse_args()
+    asyncio.run(replay(args.user_id))
+
+if __name__ == "__main__":
+    main()
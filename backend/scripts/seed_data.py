@@ -0,0 +1,261 @@
+"""
+Bulk-load a synthetic population into a local MongoDB for load and query-plan testing.
+
+Usage (from the backend directory):
+    python -m scripts.seed_data --users 100000 --mean-sessions 50 [--db icare_seed] [--drop]
+
+Activity is skewed: sessions per user follow a Pareto distribution (a few heavy
+users, a long tail of light ones), recent days are denser than old ones, and
+platforms are weighted. Every collection the app queries is filled: users with
+their preferences, time-saved and usage sessions, achievements and Idempotency-Keys,
+plus daily global counters and a purge queue. Documents are written with unordered insert_many in
+batches, several batches in flight at once. Writes go to a separate database
+(icare_seed by default), never to DB_NAME unless asked for explicitly.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from bson import ObjectId
+
+from achievements import apply_time_saved, empty_state
+from config import get_settings
+from database import database, connect_to_mongo, close_mongo_connection
+
+PLATFORMS = ["instagram", "tiktok", "youtube", "facebook"]
+PLATFORM_WEIGHTS = [50, 25, 15, 10]
+
+# Every seeded user shares one bcrypt hash of "seed-password" (hashing per user would dominate)
+SEED_PASSWORD = "seed-password"
+# Heartbeat-tracked usage sessions and idempotency keys per active user, at most
+USAGE_SESSIONS_PER_USER = 5
+IDEMPOTENCY_KEYS_PER_USER = 3
+# Finished account deletions in the purge queue
+PURGE_JOBS_DONE = 50
+
+class Seeder:
+    def __init__(self, db, args):
+        self.db = db
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.pending = set()
+        self.semaphore = asyncio.Semaphore(args.concurrency)
+        self.buffers = {
+            "users": [], "user_preferences": [], "time_sessions": [], "usage_sessions": [],
+            "user_achievements": [], "idempotency_keys": [], "global_counters": [], "purge_jobs": []
+        }
+        self.inserted = {name: 0 for name in self.buffers}
+        self.now = datetime.utcnow()
+        # (day, platform, shard) -> [minutes, sessions]
+        self.counters = Counter()
+        self.counter_sessions = Counter()
+
+    async def _insert(self, collection: str, docs):
+        try:
+            await self.db[collection].insert_many(docs, ordered=False)
+            self.inserted[collection] += len(docs)
+        finally:
+            self.semaphore.release()
+
+    async def add(self, collection: str, doc):
+        buffer = self.buffers[collection]
+        buffer.append(doc)
+        if len(buffer) >= self.args.batch_size:
+            await self.flush(collection)
+
+    async def flush(self, collection: str):
+        docs = self.buffers[collection]
+        if not docs:
+            return
+        self.buffers[collection] = []
+        # Bounded number of batches in flight keeps memory flat for any population size
+        await self.semaphore.acquire()
+        task = asyncio.create_task(self._insert(collection, docs))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    def session_count(self) -> int:
+        # Pareto with alpha 1.2 has mean alpha / (alpha - 1) = 6, rescaled to the requested mean
+        alpha = 1.2
+        count = int(self.rng.paretovariate(alpha) * self.args.mean_sessions * (alpha - 1) / alpha)
+        return min(count, self.args.max_sessions)
+
+    def session_time(self) -> datetime:
+        # Exponential age: most activity in the last weeks, a tail over the whole window
+        age_days = min(self.rng.expovariate(1 / (self.args.days / 6)), self.args.days)
+        return self.now - timedelta(days=age_days, seconds=self.rng.randrange(86400))
+
+    async def seed_user(self, index: int, password_hash: str):
+        user_id = ObjectId()
+        count = self.session_count()
+        times = sorted(self.session_time() for _ in range(count))
+        time_saved = 0
+        achievements = empty_state(user_id)
+        shards = get_settings().global_counter_shards
+
+        for version, created_at in enumerate(times, start=1):
+            minutes = max(1, int(self.rng.lognormvariate(2.3, 0.8)))
+            platform = self.rng.choices(PLATFORMS, PLATFORM_WEIGHTS)[0]
+            time_saved += minutes
+            achievements = apply_time_saved(achievements, minutes, created_at)
+            counter = (created_at.date().isoformat(), platform, self.rng.randrange(shards))
+            self.counters[counter] += minutes
+            self.counter_sessions[counter] += 1
+            await self.add("time_sessions", {
+                "user_id": user_id,
+                "platform": platform,
+                "time_spent": self.rng.randrange(30, 3600),
+                "time_saved": minutes,
+                "start_time": created_at - timedelta(minutes=minutes),
+                "end_time": created_at,
+                "version": version,
+                "created_at": created_at
+            })
+
+        # Recent heartbeat-tracked visits, replayable Idempotency-Keys and the achievements state
+        for number, created_at in enumerate(times[-USAGE_SESSIONS_PER_USER:]):
+            spent = self.rng.randrange(30, 3600)
+            await self.add("usage_sessions", {
+                "user_id": user_id,
+                "client_session_id": f"seed-{number}",
+                "platform": self.rng.choices(PLATFORMS, PLATFORM_WEIGHTS)[0],
+                "time_spent": spent,
+                "start_time": created_at - timedelta(seconds=spent),
+                "end_time": created_at,
+                "created_at": created_at
+            })
+        applied_keys = [f"seed-{number}" for number in range(min(count, IDEMPOTENCY_KEYS_PER_USER))]
+        for key in applied_keys:
+            await self.add("idempotency_keys", {
+                "_id": f"{user_id}:{key}",
+                "user_id": str(user_id),
+                "fingerprint": key,
+                "response": {"success": True, "total_time_saved": time_saved},
+                "created_at": self.now
+            })
+        if count:
+            achievements["version"] = count
+            achievements["updated_at"] = self.now
+            await self.add("user_achievements", achievements)
+
+        created_at = times[0] if times else self.now
+        await self.add("users", {
+            "_id": user_id,
+            "name": f"Seed User {index}",
+            "email": f"seed-{index}@example.com",
+            "password": password_hash,
+            "bio": None,
+            "avatar": None,
+            "subscription": "premium" if self.rng.random() < 0.08 else "free",
+            "time_saved": time_saved,
+            "referral_code": f"{index:08X}"[-8:],
+            "change_version": count,
+            "applied_keys": applied_keys,
+            "created_at": created_at,
+            "updated_at": self.now
+        })
+
+        locked = self.rng.random() < self.args.lock_ratio
+        await self.add("user_preferences", {
+            "user_id": user_id,
+            "hide_reels": self.rng.random() < 0.8,
+            "hide_stories": self.rng.random() < 0.3,
+            "hide_suggestions": self.rng.random() < 0.7,
+            "lock_mode": locked,
+            "lock_end_time": self.now + timedelta(minutes=self.rng.randrange(-60, 600)) if locked else None,
+            "version": 0,
+            "updated_at": self.now
+        })
+
+    async def run(self):
+        from auth import get_password_hash
+        password_hash = get_password_hash(SEED_PASSWORD)
+
+        start = time.perf_counter()
+        for index in range(self.args.start_index, self.args.start_index + self.args.users):
+            await self.seed_user(index, password_hash)
+            if (index - self.args.start_index + 1) % 10000 == 0:
+                self.report(start)
+        await self.seed_shared()
+        for collection in self.buffers:
+            await self.flush(collection)
+        await asyncio.gather(*list(self.pending))
+        self.report(start)
+
+    async def seed_shared(self):
+        """Global counters for every seeded day, and a purge queue with mostly finished jobs"""
+        for (day, platform, shard), minutes in self.counters.items():
+            await self.add("global_counters", {
+                "_id": f"{day}:{platform}:{shard}:{self.args.start_index}",
+                "day": day,
+                "platform": platform,
+                "shard": shard,
+                "minutes": minutes,
+                "sessions": self.counter_sessions[(day, platform, shard)]
+            })
+        for number in range(PURGE_JOBS_DONE + 2):
+            created_at = self.now - timedelta(hours=PURGE_JOBS_DONE + 2 - number)
+            job = {
+                "_id": f"account:seed-{self.args.start_index}-{number}",
+                "kind": "account",
+                "user_id": ObjectId(),
+                "status": "done",
+                "step": "sweep",
+                "deleted": {},
+                "attempts": 0,
+                "run_after": created_at,
+                "created_at": created_at,
+                "updated_at": created_at
+            }
+            # The last two are still queued: one due, one waiting for in-flight writes to settle
+            if number >= PURGE_JOBS_DONE:
+                job.update(status="pending", step="time_sessions")
+            if number == PURGE_JOBS_DONE + 1:
+                job["run_after"] = self.now + timedelta(minutes=5)
+            await self.add("purge_jobs", job)
+
+    def report(self, start: float):
+        elapsed = time.perf_counter() - start
+        total = sum(self.inserted.values())
+        counts = ", ".join(f"{name}={count}" for name, count in self.inserted.items())
+        print(f"{elapsed:8.1f}s  {counts}  ({total / max(elapsed, 1e-9):,.0f} docs/s)")
+
+async def seed(args):
+    settings = get_settings()
+    if args.drop and args.db == settings.db_name:
+        raise SystemExit(f"Refusing to drop the application database {args.db!r}")
+    # connect_to_mongo creates the same indexes the app relies on, in the seed database
+    settings.db_name = args.db
+    if args.drop:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(settings.mongo_url)
+        await client.drop_database(args.db)
+        client.close()
+
+    await connect_to_mongo()
+    try:
+        await Seeder(database.database, args).run()
+    finally:
+        await close_mongo_connection()
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a synthetic iCare population")
+    parser.add_argument("--db", default="icare_seed", help="Target database (default: icare_seed)")
+    parser.add_argument("--drop", action="store_true", help="Drop the target database first")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--start-index", type=int, default=0, help="First user index, to append to an existing seed")
+    parser.add_argument("--mean-sessions", type=float, default=20, help="Mean sessions per user")
+    parser.add_argument("--max-sessions", type=int, default=200000, help="Cap for the heaviest users")
+    parser.add_argument("--days", type=int, default=365, help="History window")
+    parser.add_argument("--lock-ratio", type=float, default=0.02, help="Share of users with lock mode on")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=8, help="insert_many batches in flight")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+    asyncio.run(seed(args))
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,26 @@
-from fastapi import FastAPI, APIRouter
-from dotenv import load_dotenv
+from fastapi import FastAPI, APIRouter, Header, HTTPException, status
 from starlette.middleware.cors import CORSMiddleware
+from typing import Optional
+import hmac
 import logging
-from pathlib import Path
 
 # Import our custom modules
-from database import connect_to_mongo, close_mongo_connection
-from routes import auth, user
+from config import get_settings
+from access_log import AccessLogMiddleware, setup_logging, stop_logging
+from profiling import ProfilingMiddleware, profiling_enabled
+from database import connect_to_mongo, close_mongo_connection, get_database
+from lock_state import lock_state
+from session_tracker import session_tracker
+from purge import purge_worker
+from single_flight import single_flight
+from deadlines import DeadlineMiddleware, timeout_metrics
+from idempotency import idempotency_store
+from compression import CompressionMiddleware
+from injection_scripts import script_variants
+from routes import auth, user, scripts, stats
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+# Resolve settings once, after .env is loaded
+settings = get_settings()
 
 # Create the main app
 app = FastAPI(title="iCare API", version="1.0.0")
@@ -22,27 +33,53 @@ api_router = APIRouter(prefix="/api")
 async def root():
     return {"message": "iCare API is running", "version": "1.0.0"}
 
+# Internal counters, only for callers presenting METRICS_TOKEN
+@api_router.get("/metrics", include_in_schema=False)
+async def metrics(x_metrics_token: Optional[str] = Header(None)):
+    token = settings.metrics_token
+    if not token or not x_metrics_token or not hmac.compare_digest(x_metrics_token.encode(), token.encode()):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return {
+        "single_flight": single_flight.metrics(),
+        "timeouts": timeout_metrics(),
+        "idempotent_replays": idempotency_store.replayed,
+        "sessions": session_tracker.metrics(),
+        "purge": purge_worker.metrics()
+    }
+
 # Include route modules
 api_router.include_router(auth.router)
 api_router.include_router(user.router)
+api_router.include_router(scripts.router)
+api_router.include_router(stats.router)
 
 # Include the router in the main app
 app.include_router(api_router)
 
+# Response compression (innermost, so the deadline 503 and CORS headers are unaffected)
+app.add_middleware(CompressionMiddleware)
+
+# Per-route deadlines (added before CORS so it runs inside it and 503s still get CORS headers)
+app.add_middleware(DeadlineMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
-    allow_origins=["*"],
+    allow_origins=settings.cors_origins,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Opt-in request profiling, not installed at all unless configured
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+
+# Structured access log (outermost, so it also sees CORS responses)
+app.add_middleware(AccessLogMiddleware)
+
+# Configure logging (written from a background thread)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
@@ -50,9 +87,18 @@ async def startup_db_client():
     """Initialize database connection"""
     await connect_to_mongo()
     logger.info("Connected to MongoDB")
+    await lock_state.start(await get_database())
+    await session_tracker.start(await get_database())
+    await purge_worker.start(await get_database())
+    # Build every injection script variant before serving requests
+    logger.info("Built %d injection script variants", len(script_variants()))
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
     """Close database connection"""
+    await purge_worker.stop()
+    await lock_state.stop()
+    await session_tracker.stop()
     await close_mongo_connection()
     logger.info("Disconnected from MongoDB")
+    stop_logging()
@@ -0,0 +1,186 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+import asyncio
+import logging
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Client heartbeat period (HEARTBEAT_INTERVAL in frontend/src/pages/SocialView.js)
+HEARTBEAT_INTERVAL_SECONDS = 10
+# Clock and network jitter allowed on top of the time actually elapsed between heartbeats
+HEARTBEAT_SLACK_SECONDS = 2
+
+class OpenSession:
+    """A usage session seen by this worker, with activity not yet written"""
+
+    __slots__ = ("user_id", "session_id", "platform", "started_at", "last_seen", "pending_seconds", "dirty")
+
+    def __init__(self, user_id: str, session_id: str, platform: str, now: datetime):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.platform = platform
+        self.started_at = now
+        self.last_seen = now
+        self.pending_seconds = 0
+        self.dirty = True
+
+class SessionTracker:
+    """In-memory open sessions, written to usage_sessions on close or periodic checkpoint.
+
+    Heartbeats only touch memory. Each write increments time_spent by the seconds
+    accumulated since the previous one and widens start_time/end_time, so heartbeats
+    of one session can land on any worker: every worker adds the activity it saw to
+    the same document. Sessions are closed explicitly or after SESSION_IDLE_SECONDS
+    of silence.
+
+    The client reports the activity since its previous heartbeat; a worker never
+    counts more than the time since it last saw the session (one heartbeat period
+    for a session new to it), and keeps at most SESSION_MAX_PER_USER open sessions
+    per user. Usage lives apart from time_sessions, so it does not change session
+    counts, achievements or delta sync.
+    """
+
+    def __init__(self):
+        self._db = None
+        self._sessions: Dict[Tuple[str, str], OpenSession] = {}
+        self._open_per_user = Counter()
+        self._task: Optional[asyncio.Task] = None
+        self.heartbeats = 0
+        self.writes = 0
+
+    async def start(self, db):
+        """Start the checkpoint loop"""
+        self._db = db
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the checkpoint loop and close every open session"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._sessions:
+            try:
+                await self._write(list(self._sessions.values()))
+            except Exception:
+                logger.exception("Could not write %d open sessions on shutdown", len(self._sessions))
+            self._sessions.clear()
+            self._open_per_user.clear()
+
+    def heartbeat(self, user_id: str, session_id: str, platform: str, elapsed: int) -> Optional[OpenSession]:
+        """Record activity on a session, without any DB access.
+
+        Returns None when the user already has too many open sessions on this worker.
+        """
+        settings = get_settings()
+        now = datetime.utcnow()
+        key = (user_id, session_id)
+        session = self._sessions.get(key)
+        if session is None:
+            if self._open_per_user[user_id] >= settings.session_max_per_user:
+                return None
+            session = OpenSession(user_id, session_id, platform, now)
+            self._add(session)
+            allowed = HEARTBEAT_INTERVAL_SECONDS
+        else:
+            allowed = (now - session.last_seen).total_seconds()
+        # Longer gaps (tab in background, lost connection) only count up to the idle timeout
+        allowed = min(allowed + HEARTBEAT_SLACK_SECONDS, settings.session_idle_seconds)
+        session.pending_seconds += min(elapsed, int(allowed))
+        session.last_seen = now
+        session.dirty = True
+        self.heartbeats += 1
+        return session
+
+    async def close(self, user_id: str, session_id: str):
+        """Write a session that the client ended and forget it"""
+        session = self._sessions.get((user_id, session_id))
+        if session is not None:
+            self._remove(session)
+            await self._write([session])
+
+    def metrics(self) -> Dict[str, int]:
+        return {"open": len(self._sessions), "heartbeats": self.heartbeats, "writes": self.writes}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(get_settings().session_checkpoint_seconds)
+            try:
+                await self._checkpoint()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Pending activity stays in memory and is retried on the next checkpoint
+                logger.exception("Session checkpoint failed")
+
+    async def _checkpoint(self):
+        """Forget idle sessions and write the activity of every changed session in one bulk write"""
+        idle_before = datetime.utcnow() - timedelta(seconds=get_settings().session_idle_seconds)
+        idle = [session for session in self._sessions.values() if session.last_seen < idle_before]
+        for session in idle:
+            self._remove(session)
+        changed = [session for session in self._sessions.values() if session.dirty]
+
+        if idle or changed:
+            await self._write(idle + changed)
+
+    async def _write(self, sessions: List[OpenSession]):
+        from pymongo import UpdateOne
+
+        requests = []
+        taken = []
+        for session in sessions:
+            update = {
+                "$inc": {"time_spent": session.pending_seconds},
+                "$min": {"start_time": session.started_at},
+                "$max": {"end_time": session.last_seen},
+                "$setOnInsert": {"platform": session.platform, "created_at": session.started_at},
+            }
+            requests.append(UpdateOne(
+                {"user_id": ObjectId(session.user_id), "client_session_id": session.session_id},
+                update,
+                upsert=True
+            ))
+            # Heartbeats arriving during the write accumulate for the next one
+            taken.append(session.pending_seconds)
+            session.pending_seconds = 0
+            session.dirty = False
+
+        try:
+            await self._db.usage_sessions.bulk_write(requests, ordered=False)
+        except Exception:
+            self._restore(sessions, taken)
+            raise
+        self.writes += len(requests)
+
+    def _restore(self, sessions: List[OpenSession], taken: List[int]):
+        """Give activity from a failed write back to the map, including closed sessions"""
+        for session, seconds in zip(sessions, taken):
+            session.pending_seconds += seconds
+            session.dirty = True
+            key = (session.user_id, session.session_id)
+            current = self._sessions.get(key)
+            if current is None:
+                self._add(session)
+            elif current is not session:
+                current.pending_seconds += session.pending_seconds
+                current.started_at = min(current.started_at, session.started_at)
+
+    def _add(self, session: OpenSession):
+        self._sessions[(session.user_id, session.session_id)] = session
+        self._open_per_user[session.user_id] += 1
+
+    def _remove(self, session: OpenSession):
+        del self._sessions[(session.user_id, session.session_id)]
+        self._open_per_user[session.user_id] -= 1
+        if not self._open_per_user[session.user_id]:
+            del self._open_per_user[session.user_id]
+
+session_tracker = SessionTracker()
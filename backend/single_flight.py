@@ -0,0 +1,44 @@
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import asyncio
+
+class SingleFlight:
+    """Coalesce concurrent identical reads into one in-flight awaitable.
+
+    Callers arriving while a call for the same key is running await its result
+    instead of issuing their own DB calls. Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = Counter()
+        self.shared = Counter()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() for key, or join the call already in flight for it"""
+        kind = key[0] if isinstance(key, tuple) else key
+        future = self._inflight.get(key)
+        if future is not None:
+            self.shared[kind] += 1
+        else:
+            self.calls[kind] += 1
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+        # Shielded so one cancelled caller does not cancel the call for the others
+        return await asyncio.shield(future)
+
+    def _finish(self, key: Hashable, future: asyncio.Future):
+        self._inflight.pop(key, None)
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not future.cancelled():
+            future.exception()
+
+    def metrics(self) -> Dict[str, Dict[str, int]]:
+        """Calls executed and duplicate calls avoided, per key kind"""
+        return {
+            kind: {"executed": self.calls[kind], "avoided": self.shared[kind]}
+            for kind in sorted(set(self.calls) | set(self.shared))
+        }
+
+single_flight = SingleFlight()
@@ -2,11 +2,15 @@ import { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { useUser } from '../contexts/UserContext';
 import { socialNetworks } from '../utils/mockData';
+import { userAPI } from '../services/api';
 import { Button } from '../components/ui/button';
 import { Card, CardContent } from '../components/ui/card';
 import { ArrowLeft, ExternalLink, Shield, Clock, Zap } from 'lucide-react';
 import InstagramSimulator from '../components/InstagramSimulator';
 
+// Seconds between usage heartbeats sent to the backend
+const HEARTBEAT_INTERVAL = 10;
+
 const SocialView = () => {
   const { platform } = useParams();
   const navigate = useNavigate();
@@ -24,6 +28,26 @@ const SocialView = () => {
     return () => clearInterval(timer);
   }, [sessionStart]);
 
+  // Usage tracking: one heartbeat every few seconds, and a final one when leaving the page
+  useEffect(() => {
+    const sessionId = crypto.randomUUID();
+    let lastBeat = Date.now();
+    const beat = (ended = false) => {
+      const now = Date.now();
+      const elapsed = Math.round((now - lastBeat) / 1000);
+      lastBeat = now;
+      userAPI.sessionHeartbeat({ session_id: sessionId, platform, elapsed, ended }).catch(() => {});
+    };
+
+    beat();
+    const heartbeat = setInterval(() => beat(), HEARTBEAT_INTERVAL * 1000);
+
+    return () => {
+      clearInterval(heartbeat);
+      beat(true);
+    };
+  }, [platform]);
+
   const handleClose = () => {
     const minutesSpent = Math.floor(timeSpent / 60);
     const estimatedSaved = Math.floor(minutesSpent * 0.3); // Estimation: 30% de temps sauvé
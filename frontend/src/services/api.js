@@ -3,6 +3,9 @@ import axios from 'axios';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API_BASE = `${BACKEND_URL}/api`;
 
+// Retries of a time-saved write (1s, 2s, 4s, 8s apart, enough to outlast a stale reservation)
+const TIME_SAVED_RETRIES = 4;
+
 // Create axios instance
 const api = axios.create({
   baseURL: API_BASE,
@@ -69,14 +72,59 @@ export const userAPI = {
     return response.data;
   },
 
-  addTimeSaved: async (timeData) => {
-    const response = await api.post('/user/time-saved', timeData);
-    return response.data;
+  addTimeSaved: async (timeData, idempotencyKey = crypto.randomUUID()) => {
+    // Every attempt sends the same key, so the server counts the time only once
+    for (let attempt = 0; ; attempt++) {
+      try {
+        const response = await api.post('/user/time-saved', timeData, {
+          headers: { 'Idempotency-Key': idempotencyKey },
+        });
+        return response.data;
+      } catch (error) {
+        // Network errors, 5xx and 409 (same request still in progress) are retried
+        const status = error.response?.status;
+        const retryable = !error.response || status >= 500 || status === 409;
+        if (!retryable || attempt >= TIME_SAVED_RETRIES) {
+          throw error;
+        }
+        await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** attempt));
+      }
+    }
   },
 
   getStats: async () => {
     const response = await api.get('/user/stats');
     return response.data;
+  },
+
+  sessionHeartbeat: async (heartbeat) => {
+    // { session_id, platform, elapsed, ended }: kept in memory server-side, cheap to send often
+    const response = await api.post('/user/sessions/heartbeat', heartbeat);
+    return response.data;
+  },
+
+  sync: async (since = 0) => {
+    const response = await api.get('/user/sync', { params: { since } });
+    return response.data;
+  },
+
+  deleteAccount: async () => {
+    // Deletion runs in the background, poll getAccountDeletion for progress
+    const response = await api.delete('/user/account');
+    return response.data;
+  },
+
+  getAccountDeletion: async () => {
+    const response = await api.get('/user/account/deletion');
+    return response.data;
+  }
+};
+
+// Public stats API
+export const statsAPI = {
+  getGlobal: async () => {
+    const response = await api.get('/stats/global');
+    return response.data;
   }
 };
 
@@ -0,0 +1,47 @@
+import asyncio
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+# Backend modules import each other as top-level modules (uvicorn runs from backend/)
+sys.path.insert(0, str(BACKEND_DIR))
+
+@pytest.fixture
+def db(monkeypatch):
+    """In-memory database (mongomock) behind get_database()"""
+    from mongomock_motor import AsyncMongoMockClient
+    import database
+
+    mock_db = AsyncMongoMockClient()["icare_test"]
+    monkeypatch.setattr(database.database, "database", mock_db)
+    return mock_db
+
+@pytest.fixture
+def client(db):
+    """Test client for the app, without the startup hooks (no Mongo connection, no background loops)"""
+    from fastapi.testclient import TestClient
+    import server
+
+    return TestClient(server.app)
+
+@pytest.fixture
+def user(db):
+    """A registered user: (user_id, Authorization headers)"""
+    from bson import ObjectId
+    from auth import create_access_token
+
+    user_id = ObjectId()
+    asyncio.run(db.users.insert_one({
+        "_id": user_id,
+        "name": "Test",
+        "email": f"{user_id}@example.com",
+        "password": "unused",
+        "time_saved": 0,
+        "change_version": 0,
+        "created_at": datetime.utcnow()
+    }))
+    return user_id, {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
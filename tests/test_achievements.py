@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from datetime import datetime, date
+
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockCollection
+from pymongo.errors import DuplicateKeyError
+
+from access_log import hash_user_id
+from achievements import apply_time_saved, current_streak, empty_state, record_time_saved
+
+def replay(events):
+    state = empty_state(ObjectId())
+    for minutes, at in events:
+        state = apply_time_saved(state, minutes, at)
+    return state
+
+def test_totals_and_first_milestones():
+    at = datetime(2026, 3, 1, 9)
+    state = replay([(30, at), (40, at)])
+    assert state["total_minutes"] == 70
+    assert state["total_sessions"] == 2
+    assert set(state["unlocked"]) == {"first_session", "hour_saved"}
+    assert state["unlocked"]["first_session"] == at
+
+def test_apply_does_not_modify_the_previous_state():
+    state = empty_state(ObjectId())
+    new_state = apply_time_saved(state, 5, datetime(2026, 3, 1))
+    assert state["total_sessions"] == 0
+    assert state["unlocked"] == {}
+    assert new_state["unlocked"] is not state["unlocked"]
+
+def test_consecutive_days_extend_the_streak():
+    state = replay([(5, datetime(2026, 3, day, 12)) for day in (1, 2, 2, 3)])
+    assert state["current_streak"] == 3
+    assert state["best_streak"] == 3
+    assert "streak_3" in state["unlocked"]
+
+def test_skipped_day_restarts_the_streak_but_keeps_the_best():
+    state = replay([(5, datetime(2026, 3, day)) for day in (1, 2, 3, 5)])
+    assert state["current_streak"] == 1
+    assert state["best_streak"] == 3
+    assert state["last_active_day"] == "2026-03-05"
+
+def test_late_event_for_an_older_day_leaves_the_streak_alone():
+    state = replay([(5, datetime(2026, 3, 2)), (5, datetime(2026, 3, 3)), (5, datetime(2026, 3, 1))])
+    assert state["current_streak"] == 2
+    assert state["last_active_day"] == "2026-03-03"
+    assert state["total_sessions"] == 3
+
+def test_current_streak_as_of_today():
+    state = replay([(5, datetime(2026, 3, day)) for day in (1, 2)])
+    assert current_streak(state, today=date(2026, 3, 2)) == 2
+    assert current_streak(state, today=date(2026, 3, 3)) == 2
+    assert current_streak(state, today=date(2026, 3, 4)) == 0
+    assert current_streak(None) == 0
+    assert current_streak(empty_state(ObjectId())) == 0
+
+def test_lost_update_is_logged_without_the_raw_user_id(db, monkeypatch, caplog):
+    async def always_raced(self, *args, **kwargs):
+        raise DuplicateKeyError("raced")
+
+    monkeypatch.setattr(AsyncMongoMockCollection, "update_one", always_raced)
+    user_id = ObjectId()
+    with caplog.at_level(logging.WARNING, logger="achievements"):
+        assert asyncio.run(record_time_saved(db, user_id, 5)) is None
+    assert hash_user_id(str(user_id)) in caplog.text
+    assert str(user_id) not in caplog.text
@@ -0,0 +1,64 @@
+import asyncio
+import gzip
+
+from compression import CompressionMiddleware, available_encoders, choose_encoding
+
+def test_choose_encoding_follows_server_preference():
+    preferred = next(name for name in available_encoders() if name in ("zstd", "br", "gzip"))
+    assert choose_encoding("gzip, deflate, br, zstd") == preferred
+    assert choose_encoding("gzip;q=0.5") == "gzip"
+    assert choose_encoding("GZIP") == "gzip"
+
+def test_choose_encoding_ignores_refused_and_unknown_encodings():
+    assert choose_encoding("gzip;q=0, zstd;q=0.0, br; q=0") is None
+    assert choose_encoding("deflate, identity") is None
+
+def run_app(body_chunks, content_type=b"application/json", accept_encoding=b"gzip"):
+    """Run the middleware around a minimal ASGI app, return the sent messages"""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", content_type),
+            (b"content-length", str(sum(len(chunk) for chunk in body_chunks)).encode())
+        ]})
+        for index, chunk in enumerate(body_chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": index < len(body_chunks) - 1})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request"}
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", accept_encoding)]}
+    asyncio.run(CompressionMiddleware(app)(scope, receive, send))
+    return sent
+
+def test_large_response_is_compressed_with_matching_length():
+    body = b'{"sessions": [' + b'{"platform": "instagram"},' * 200 + b'{}]}'
+    start, message = run_app([body])
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert int(headers[b"content-length"]) == len(message["body"])
+    assert gzip.decompress(message["body"]) == body
+
+def test_small_response_is_sent_as_is():
+    start, message = run_app([b'{"success": true}'])
+    assert b"content-encoding" not in dict(start["headers"])
+    assert message["body"] == b'{"success": true}'
+
+def test_streamed_response_is_compressed_per_chunk():
+    chunks = [b"data: x\n\n" * 50, b"data: y\n\n" * 50, b""]
+    messages = run_app(chunks, content_type=b"text/plain")
+    headers = dict(messages[0]["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    assert gzip.decompress(b"".join(message.get("body", b"") for message in messages[1:])) == b"".join(chunks)
+
+def test_event_streams_and_unaccepted_encodings_pass_through():
+    body = b"data: unlock\n\n" * 200
+    for messages in (run_app([body], content_type=b"text/event-stream"), run_app([body], accept_encoding=b"identity")):
+        assert b"content-encoding" not in dict(messages[0]["headers"])
+        assert messages[1]["body"] == body
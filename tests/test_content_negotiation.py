@@ -0,0 +1,36 @@
+import msgpack
+import pytest
+
+from content_negotiation import MSGPACK_MEDIA_TYPE, accepts_msgpack
+
+@pytest.mark.parametrize("accept, expected", [
+    ("application/msgpack", True),
+    ("application/json, application/x-msgpack;q=0.5", True),
+    ("application/msgpack;q=0", False),
+    ("application/msgpack; q=0.0, application/json", False),
+    ("application/msgpackx", False),
+    ("text/plain;format=application/msgpack", False),
+    ("", False),
+])
+def test_accepts_msgpack(accept, expected):
+    assert accepts_msgpack(accept) is expected
+
+def test_sync_in_msgpack_matches_json(client, user):
+    _user_id, headers = user
+    assert client.post("/api/user/time-saved", json={"minutes": 10}, headers=headers).status_code == 200
+
+    as_json = client.get("/api/user/sync", headers=headers)
+    packed = client.get("/api/user/sync", headers={**headers, "Accept": "application/msgpack, application/json;q=0.5"})
+
+    assert packed.status_code == 200
+    assert packed.headers["content-type"] == MSGPACK_MEDIA_TYPE
+    assert "Accept" in packed.headers["vary"]
+    assert msgpack.unpackb(packed.content) == as_json.json()
+
+def test_refused_msgpack_falls_back_to_json(client, user):
+    _user_id, headers = user
+    response = client.get("/api/user/stats", headers={**headers, "Accept": "application/msgpack;q=0, application/json"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.json()["time_saved"] == 0
@@ -0,0 +1,72 @@
+import asyncio
+from collections import Counter
+
+import pytest
+from pymongo.errors import ExecutionTimeout
+
+import deadlines
+import routes.user
+from config import get_settings
+from request_context import current_request
+
+@pytest.fixture(autouse=True)
+def fresh_counters(monkeypatch):
+    monkeypatch.setattr(deadlines, "timeouts", Counter())
+
+@pytest.fixture
+def short_stats_deadline(monkeypatch):
+    monkeypatch.setitem(deadlines.ROUTE_DEADLINES_MS, "/api/user/stats", 50)
+
+def metrics(client, monkeypatch):
+    monkeypatch.setattr(get_settings(), "metrics_token", "secret")
+    response = client.get("/api/metrics", headers={"X-Metrics-Token": "secret"})
+    assert response.status_code == 200
+    return response.json()["timeouts"]
+
+def test_slow_handler_gets_503_and_is_counted(client, user, short_stats_deadline, monkeypatch):
+    _user_id, headers = user
+
+    async def slow_load(db, user_id):
+        await asyncio.sleep(1)
+
+    monkeypatch.setattr(routes.user, "_load_stats", slow_load)
+    response = client.get("/api/user/stats", headers=headers)
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert response.json()["detail"] == "Délai de traitement dépassé, veuillez réessayer"
+    assert metrics(client, monkeypatch) == {"/api/user/stats": {"handler": 1}}
+
+def test_db_timeout_is_counted_under_the_failed_command(client, user, short_stats_deadline, monkeypatch):
+    _user_id, headers = user
+
+    async def timed_out_load(db, user_id):
+        # What the command listener records before pymongo raises
+        current_request().failed_command = "count"
+        raise ExecutionTimeout("operation exceeded time limit", 50)
+
+    monkeypatch.setattr(routes.user, "_load_stats", timed_out_load)
+    assert client.get("/api/user/stats", headers=headers).status_code == 503
+    assert client.get("/api/user/stats", headers=headers).status_code == 503
+    assert metrics(client, monkeypatch) == {"/api/user/stats": {"count": 2}}
+
+def test_requests_within_the_deadline_are_untouched(client, user, short_stats_deadline, monkeypatch):
+    _user_id, headers = user
+
+    assert client.get("/api/user/stats", headers=headers).status_code == 200
+    assert metrics(client, monkeypatch) == {}
+
+def test_routes_without_a_deadline_are_not_cut(client, user, short_stats_deadline, monkeypatch):
+    _user_id, headers = user
+    original = routes.user._load_stats
+
+    async def slowish_load(db, user_id):
+        await asyncio.sleep(0.1)
+        return await original(db, user_id)
+
+    monkeypatch.setattr(routes.user, "_load_stats", slowish_load)
+    assert client.get("/api/user/stats", headers=headers).status_code == 503
+
+    monkeypatch.setitem(deadlines.ROUTE_DEADLINES_MS, "/api/user/stats", None)
+    assert client.get("/api/user/stats", headers=headers).status_code == 200
+    assert metrics(client, monkeypatch) == {"/api/user/stats": {"handler": 1}}
@@ -0,0 +1,40 @@
+from typing import get_args
+
+import pytest
+
+from global_counters import global_counters
+from injection_scripts import PLATFORM_SELECTORS
+from models import MAX_TIME_SAVED_MINUTES, Platform
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    global_counters._cache = {}
+
+def test_platforms_match_the_injection_scripts():
+    assert set(get_args(Platform)) == set(PLATFORM_SELECTORS)
+
+def test_time_saved_is_counted_per_platform(client, user):
+    _user_id, headers = user
+    client.post("/api/user/time-saved", json={"minutes": 30, "platform": "tiktok"}, headers=headers)
+    client.post("/api/user/time-saved", json={"minutes": 90}, headers=headers)
+
+    stats = client.get("/api/stats/global").json()
+    assert stats["total_minutes"] == 120
+    assert stats["total_hours"] == 2.0
+    assert [(row["platform"], row["minutes"], row["sessions"]) for row in stats["platforms"]] == [
+        ("instagram", 90, 1), ("tiktok", 30, 1)
+    ]
+
+@pytest.mark.parametrize("body", [
+    {"minutes": -100000},
+    {"minutes": 0},
+    {"minutes": MAX_TIME_SAVED_MINUTES + 1},
+    {"minutes": 10, "platform": "evil<script>"},
+])
+def test_invalid_time_saved_never_reaches_the_counters(client, db, user, body):
+    _user_id, headers = user
+    assert client.post("/api/user/time-saved", json=body, headers=headers).status_code == 422
+
+    stats = client.get("/api/stats/global").json()
+    assert stats["total_minutes"] == 0
+    assert stats["platforms"] == []
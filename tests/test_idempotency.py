@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from idempotency import PENDING_LEASE_SECONDS, idempotency_store
+import routes.user
+
+def stored_user(db, user_id):
+    return asyncio.run(db.users.find_one({"_id": user_id}))
+
+def sessions(db, user_id):
+    return asyncio.run(db.time_sessions.count_documents({"user_id": user_id}))
+
+def test_retry_replays_the_first_response(client, db, user):
+    user_id, headers = user
+    headers = dict(headers, **{"Idempotency-Key": "retry-1"})
+    first = client.post("/api/user/time-saved", json={"minutes": 30}, headers=headers)
+    second = client.post("/api/user/time-saved", json={"minutes": 30}, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json() == {"success": True, "total_time_saved": 30}
+    assert stored_user(db, user_id)["time_saved"] == 30
+    assert sessions(db, user_id) == 1
+
+def test_replay_from_the_database_on_another_worker(client, db, user):
+    user_id, headers = user
+    headers = dict(headers, **{"Idempotency-Key": "retry-2"})
+    client.post("/api/user/time-saved", json={"minutes": 15}, headers=headers)
+    # Another worker has nothing in memory
+    idempotency_store._recent.clear()
+
+    response = client.post("/api/user/time-saved", json={"minutes": 15}, headers=headers)
+    assert response.json() == {"success": True, "total_time_saved": 15}
+    assert stored_user(db, user_id)["time_saved"] == 15
+
+def test_key_reused_for_another_body_is_rejected(client, db, user):
+    user_id, headers = user
+    headers = dict(headers, **{"Idempotency-Key": "retry-3"})
+    client.post("/api/user/time-saved", json={"minutes": 10}, headers=headers)
+
+    response = client.post("/api/user/time-saved", json={"minutes": 11}, headers=headers)
+    assert response.status_code == 422
+    assert stored_user(db, user_id)["time_saved"] == 10
+
+def test_key_in_flight_is_a_conflict(client, db, user):
+    user_id, headers = user
+    asyncio.run(db.idempotency_keys.insert_one({
+        "_id": f"{user_id}:retry-4",
+        "user_id": str(user_id),
+        "fingerprint": idempotency_store.fingerprint({"minutes": 5, "platform": "instagram"}),
+        "response": None,
+        "created_at": datetime.utcnow()
+    }))
+
+    response = client.post("/api/user/time-saved", json={"minutes": 5}, headers=dict(headers, **{"Idempotency-Key": "retry-4"}))
+    assert response.status_code == 409
+    assert stored_user(db, user_id)["time_saved"] == 0
+
+def test_abandoned_reservation_is_taken_over_without_applying_twice(client, db, user):
+    """The first attempt updated the total, then died before storing its response"""
+    user_id, headers = user
+    asyncio.run(db.users.update_one({"_id": user_id}, {"$inc": {"time_saved": 20}, "$push": {"applied_keys": "retry-5"}}))
+    asyncio.run(db.idempotency_keys.insert_one({
+        "_id": f"{user_id}:retry-5",
+        "user_id": str(user_id),
+        "fingerprint": idempotency_store.fingerprint({"minutes": 20, "platform": "instagram"}),
+        "response": None,
+        "created_at": datetime.utcnow() - timedelta(seconds=PENDING_LEASE_SECONDS + 1)
+    }))
+
+    response = client.post("/api/user/time-saved", json={"minutes": 20}, headers=dict(headers, **{"Idempotency-Key": "retry-5"}))
+    assert response.status_code == 200
+    assert response.json() == {"success": True, "total_time_saved": 20}
+    assert stored_user(db, user_id)["time_saved"] == 20
+
+def test_failed_follow_up_write_keeps_the_key(client, db, user, monkeypatch):
+    """Once the total is updated, the response is final even if a later write fails"""
+    user_id, headers = user
+    headers = dict(headers, **{"Idempotency-Key": "retry-6"})
+
+    async def fail(*args, **kwargs):
+        raise RuntimeError("counter shard unavailable")
+
+    monkeypatch.setattr(routes.user.global_counters, "add", fail)
+    first = client.post("/api/user/time-saved", json={"minutes": 25}, headers=headers)
+    monkeypatch.undo()
+    second = client.post("/api/user/time-saved", json={"minutes": 25}, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == {"success": True, "total_time_saved": 25}
+    assert stored_user(db, user_id)["time_saved"] == 25
+    assert stored_user(db, user_id)["applied_keys"] == ["retry-6"]
+
+def test_unknown_user_releases_the_key(client, db, user):
+    user_id, headers = user
+    # Account status is cached as active, the user document goes away afterwards
+    client.get("/api/user/stats", headers=headers)
+    asyncio.run(db.users.delete_one({"_id": user_id}))
+
+    response = client.post("/api/user/time-saved", json={"minutes": 5}, headers=dict(headers, **{"Idempotency-Key": "retry-7"}))
+    assert response.status_code == 404
+    assert asyncio.run(db.idempotency_keys.count_documents({})) == 0
@@ -0,0 +1,79 @@
+"""
+Cold-start budget: importing the app and running its startup must stay fast.
+
+Each run is a fresh interpreter that imports the app and the Mongo driver (the
+startup hook imports it), then runs the startup handlers against an in-memory
+database, so the driver's import cost is counted without a server to connect to.
+The fastest of five runs is compared against the budget: 420 to 560 ms on a busy
+single core, so the budget leaves about twice that before failing.
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+BUDGET_MS = float(os.environ.get('STARTUP_TIME_BUDGET_MS', '1000'))
+RUNS = 5
+
+# Modules that must not be imported while building the app
+# (only needed once a request or the DB connection needs them)
+LAZY_MODULES = ["pymongo", "motor", "passlib", "jose"]
+
+STARTUP_PROBE = """
+import asyncio, time
+start = time.perf_counter()
+import server
+import motor.motor_asyncio
+imported = time.perf_counter()
+
+import mongomock_motor
+motor.motor_asyncio.AsyncIOMotorClient = lambda url, **kwargs: mongomock_motor.AsyncMongoMockClient()
+
+async def startup():
+    began = time.perf_counter()
+    await server.app.router.startup()
+    return time.perf_counter() - began
+
+print((imported - start + asyncio.run(startup())) * 1000)
+"""
+
+IMPORT_PROBE = "import server"
+
+def run_probe(probe):
+    """Run a probe in a fresh interpreter, return (stdout, {module: cumulative import us})"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative_us)
+    return result.stdout, modules
+
+def run_startup():
+    """Import and start the app once, return (wall ms, {module: cumulative import us})"""
+    stdout, modules = run_probe(STARTUP_PROBE)
+    return float(stdout.strip().splitlines()[-1]), modules
+
+def test_app_startup_time_within_budget():
+    wall_ms, modules = min((run_startup() for _ in range(RUNS)), key=lambda run: run[0])
+    slowest = ", ".join(
+        f"{name} {cumulative_us / 1000:.0f} ms"
+        for name, cumulative_us in sorted(modules.items(), key=lambda item: -item[1])[:5]
+    )
+    assert wall_ms <= BUDGET_MS, f"startup took {wall_ms:.1f} ms (budget {BUDGET_MS:.0f} ms); slowest imports: {slowest}"
+
+def test_heavy_modules_stay_lazy():
+    _stdout, modules = run_probe(IMPORT_PROBE)
+    eager = [name for name in LAZY_MODULES if name in modules]
+    assert not eager, f"imported eagerly: {', '.join(eager)}"
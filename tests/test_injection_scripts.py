@@ -0,0 +1,39 @@
+import json
+
+from injection_scripts import (
+    PLATFORM_SELECTORS, SCRIPT_FLAGS, SCRIPT_TEMPLATE, minify, script_variants, variant_for, variant_by_digest
+)
+
+def test_minify_strips_comments_and_whitespace():
+    minified = minify(SCRIPT_TEMPLATE)
+    assert "\n" not in minified
+    assert "//" not in minified
+    assert 'var id="icare-hide";' in minified
+    assert minified.startswith("(function(){") and minified.endswith("})();")
+
+def test_one_variant_per_platform_and_flag_combination():
+    variants = script_variants()
+    assert len(variants) == len(PLATFORM_SELECTORS) * 2 ** len(SCRIPT_FLAGS)
+    # Digests are unique per platform (without flags, every platform gets the same body)
+    assert len({(variant.platform, variant.digest) for variant in variants.values()}) == len(variants)
+    for (platform, _flags), variant in variants.items():
+        assert variant.url == f"/api/scripts/{platform}/{variant.digest}.js"
+        assert variant.etag == f'"{variant.digest}"'
+
+def test_variant_for_preferences():
+    variant = variant_for("instagram", {"hide_reels": True, "hide_stories": None})
+    assert variant.flags == (True, False, False)
+    for selector in PLATFORM_SELECTORS["instagram"]["hide_reels"]:
+        assert json.dumps(selector)[1:-1] in variant.body.decode()
+    assert PLATFORM_SELECTORS["instagram"]["hide_suggestions"][0] not in variant.body.decode()
+    assert variant_for("myspace", {}) is None
+
+def test_no_flags_clears_the_rules():
+    variant = variant_for("youtube", {})
+    assert b'style.textContent="";' in variant.body
+
+def test_variant_by_digest():
+    variant = variant_for("tiktok", {"hide_suggestions": True})
+    assert variant_by_digest("tiktok", variant.digest) is variant
+    assert variant_by_digest("instagram", variant.digest) is None
+    assert variant_by_digest("tiktok", "0" * 16) is None
@@ -0,0 +1,81 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from lock_state import LockStateService
+
+@pytest.fixture
+def service():
+    service = LockStateService()
+    service.cleared = []
+
+    async def clear_locks(user_ids, now):
+        service.cleared.append([str(user_id) for user_id in user_ids])
+
+    service._clear_locks = clear_locks
+    return service
+
+def test_locks_follow_preferences(service):
+    future = datetime.utcnow() + timedelta(hours=1)
+    service.update_from_preferences("u1", {"lock_mode": True, "lock_end_time": future})
+    assert service.is_locked("u1")
+    assert service.lock_end_time("u1") == future
+
+    service.update_from_preferences("u1", {"lock_mode": False, "lock_end_time": None})
+    assert not service.is_locked("u1")
+    # Already expired locks are not tracked
+    service.update_from_preferences("u2", {"lock_mode": True, "lock_end_time": datetime.utcnow() - timedelta(seconds=1)})
+    assert not service.is_locked("u2")
+
+def test_expire_due_clears_only_current_deadlines(service):
+    past = datetime.utcnow() - timedelta(seconds=1)
+    service._set("a" * 24, past)
+    service._set("b" * 24, past - timedelta(seconds=1))
+    # Replaced lock: its old heap entry is stale
+    service._set("c" * 24, past)
+    service._set("c" * 24, datetime.utcnow() + timedelta(hours=1))
+    queue = service.subscribe("a" * 24)
+
+    asyncio.run(service._expire_due())
+
+    assert sorted(service.cleared[0]) == ["a" * 24, "b" * 24]
+    assert service.is_locked("c" * 24)
+    assert not service._locks.get("a" * 24)
+    assert queue.get_nowait()["type"] == "unlock"
+    assert [user_id for _, user_id in service._heap] == ["c" * 24]
+
+def test_expire_due_keeps_the_heap_when_the_write_fails(service):
+    async def fail(user_ids, now):
+        raise RuntimeError("write failed")
+
+    service._clear_locks = fail
+    service._set("a" * 24, datetime.utcnow() - timedelta(seconds=1))
+    with pytest.raises(RuntimeError):
+        asyncio.run(service._expire_due())
+    assert len(service._heap) == 1
+    assert "a" * 24 in service._locks
+
+def test_earlier_lock_wakes_the_expiry_loop(service):
+    service._wakeup = asyncio.Event()
+    service._set("a" * 24, datetime.utcnow() + timedelta(hours=2))
+    service._wakeup.clear()
+    service._set("b" * 24, datetime.utcnow() + timedelta(hours=3))
+    assert not service._wakeup.is_set()
+    service._set("c" * 24, datetime.utcnow() + timedelta(hours=1))
+    assert service._wakeup.is_set()
+
+def test_change_stream_tracks_locks_and_publishes_remote_unlocks(service):
+    end = datetime.utcnow() + timedelta(hours=1)
+    service._apply_change({"fullDocument": {"user_id": "a" * 24, "lock_mode": True, "lock_end_time": end}})
+    assert service.is_locked("a" * 24)
+    queue = service.subscribe("a" * 24)
+
+    # Cleared by the worker that expired it first
+    service._apply_change({"fullDocument": {"user_id": "a" * 24, "lock_mode": False, "lock_end_time": None}})
+    assert not service.is_locked("a" * 24)
+    assert queue.get_nowait() == {"type": "unlock", "user_id": "a" * 24, "lock_end_time": end.isoformat()}
+
+    # Changes to untracked users publish nothing
+    service._apply_change({"fullDocument": {"user_id": "a" * 24, "lock_mode": False, "hide_reels": True}})
+    assert queue.empty()
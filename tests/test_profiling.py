@@ -0,0 +1,56 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from config import get_settings
+from profiling import ProfilingMiddleware
+
+@pytest.fixture
+def profiled(tmp_path, monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "profile_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "profile_token", "secret")
+    monkeypatch.setattr(settings, "profile_interval_ms", 1)
+    return tmp_path
+
+def call(middleware, path):
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "GET", "path": path, "headers": [(b"x-debug-profile", b"secret")]}
+    asyncio.run(middleware(scope, receive, send))
+
+def test_profile_is_written_off_the_event_loop(profiled):
+    loop_thread = threading.get_ident()
+    writers = []
+
+    async def app(scope, receive, send):
+        await asyncio.sleep(0.02)
+
+    middleware = ProfilingMiddleware(app)
+    write = middleware._write
+
+    def recording_write(sampler, summary):
+        writers.append(threading.get_ident())
+        write(sampler, summary)
+
+    middleware._write = recording_write
+    call(middleware, "/api/user/stats")
+
+    assert writers and writers[0] != loop_thread
+    summary = json.loads(next(profiled.glob("*.json")).read_text())
+    assert summary["route"] == "/api/user/stats"
+    assert summary["samples"] > 0
+    assert len(list(profiled.glob("*.collapsed"))) == 1
+
+def test_event_streams_are_not_profiled(profiled):
+    async def app(scope, receive, send):
+        pass
+
+    call(ProfilingMiddleware(app), "/api/user/lock/events")
+    assert list(profiled.iterdir()) == []
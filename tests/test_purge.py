@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from config import get_settings
+from purge import PURGE_MAX_BATCH, PURGE_MIN_BATCH, PurgeWorker
+
+@pytest.fixture
+def worker():
+    worker = PurgeWorker()
+    worker.batch_size = 400
+    return worker
+
+def test_slow_batch_halves_the_size_and_pauses_twice_as_long(worker):
+    latency_ms = get_settings().purge_target_latency_ms * 2
+    assert worker._adapt(latency_ms) == pytest.approx(latency_ms * 2 / 1000)
+    assert worker.batch_size == 200
+    assert worker.last_latency_ms == latency_ms
+
+def test_fast_batch_grows_the_size_slowly(worker):
+    worker._adapt(get_settings().purge_target_latency_ms / 4)
+    assert worker.batch_size == 500
+
+def test_batch_near_the_target_keeps_the_size(worker):
+    latency_ms = get_settings().purge_target_latency_ms * 0.75
+    assert worker._adapt(latency_ms) == pytest.approx(latency_ms / 1000)
+    assert worker.batch_size == 400
+
+def test_batch_size_stays_within_bounds(worker):
+    target_ms = get_settings().purge_target_latency_ms
+    for _ in range(20):
+        worker._adapt(target_ms * 10)
+    assert worker.batch_size == PURGE_MIN_BATCH
+    for _ in range(50):
+        worker._adapt(0)
+    assert worker.batch_size == PURGE_MAX_BATCH
+
+@pytest.fixture
+def purge_db(db, monkeypatch):
+    from mongomock_motor import AsyncMongoMockCollection
+
+    # mongomock_motor's with_options returns a synchronous collection
+    monkeypatch.setattr(AsyncMongoMockCollection, "with_options", lambda collection, **kwargs: collection, raising=False)
+    return db
+
+def run_job(worker, db, job):
+    async def run():
+        worker._db = db
+        await db.purge_jobs.insert_one(dict(job))
+        assert await worker._process(job)
+        return await db.purge_jobs.find_one({"_id": job["_id"]})
+    return asyncio.run(run())
+
+def test_retention_deletes_old_sessions_of_every_user(worker, purge_db):
+    now = datetime.utcnow()
+    users = [ObjectId(), ObjectId()]
+    asyncio.run(purge_db.time_sessions.insert_many([
+        {"user_id": user_id, "time_saved": 5, "created_at": now - timedelta(days=age)}
+        for user_id in users for age in (400, 100, 1)
+    ]))
+    asyncio.run(purge_db.usage_sessions.insert_many([
+        {"user_id": users[0], "client_session_id": f"s{age}", "created_at": now - timedelta(days=age)}
+        for age in (400, 1)
+    ]))
+    worker.batch_size = PURGE_MIN_BATCH
+
+    job = run_job(worker, purge_db, {
+        "_id": "retention:test", "kind": "retention", "before": now - timedelta(days=365),
+        "status": "running", "deleted": {}, "attempts": 0
+    })
+
+    assert job["status"] == "done"
+    assert job["deleted"] == {"time_sessions": 2, "usage_sessions": 1}
+    remaining = asyncio.run(purge_db.time_sessions.find({}, {"created_at": 1}).to_list(None))
+    assert len(remaining) == 4
+    assert all(session["created_at"] > now - timedelta(days=365) for session in remaining)
+    assert asyncio.run(purge_db.usage_sessions.count_documents({})) == 1
+
+def test_account_job_deletes_every_document_of_the_user(worker, purge_db):
+    user_id, other_id = ObjectId(), ObjectId()
+    now = datetime.utcnow()
+    async def seed():
+        await purge_db.users.insert_many([{"_id": user_id}, {"_id": other_id}])
+        for owner in (user_id, other_id):
+            await purge_db.time_sessions.insert_many([{"user_id": owner, "created_at": now - timedelta(minutes=i)} for i in range(120)])
+            await purge_db.usage_sessions.insert_one({"user_id": owner, "client_session_id": "s", "created_at": now})
+            await purge_db.user_achievements.insert_one({"user_id": owner})
+            await purge_db.user_preferences.insert_one({"user_id": owner})
+    asyncio.run(seed())
+    worker.batch_size = PURGE_MIN_BATCH
+
+    job = run_job(worker, purge_db, {
+        "_id": f"account:{user_id}", "kind": "account", "user_id": user_id, "step": "time_sessions",
+        "status": "running", "deleted": {}, "attempts": 0
+    })
+
+    assert job["status"] == "done"
+    assert job["deleted"]["time_sessions"] == 120
+    for name in ("time_sessions", "usage_sessions", "user_achievements", "user_preferences"):
+        assert asyncio.run(purge_db[name].count_documents({"user_id": user_id})) == 0
+        assert asyncio.run(purge_db[name].count_documents({"user_id": other_id})) == (120 if name == "time_sessions" else 1)
+    assert asyncio.run(purge_db.users.count_documents({})) == 1
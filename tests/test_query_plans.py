@@ -0,0 +1,269 @@
+"""
+Query-plan regression test: explain() every query the routes issue and fail on bad plans.
+
+Needs a MongoDB server (MONGO_URL) and is skipped when none is reachable. A small
+skewed population is seeded with scripts.seed_data into a scratch database, which
+is dropped afterwards. Each query runs with executionStats verbosity for a few
+sampled users; explaining writes (findAndModify, update) does not modify any data.
+A query fails when its winning plan contains a COLLSCAN, when documents examined
+exceed MAX_RATIO times the documents returned, or when it matches nothing for
+every sampled user (unless it may legitimately be empty): an explain on data the
+seed does not cover would check nothing.
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Dict, List
+
+import pytest
+from bson import ObjectId
+
+from config import get_settings
+from database import database, connect_to_mongo, close_mongo_connection
+
+# Max documents examined per document returned
+MAX_RATIO = 1.5
+# Users sampled to explain queries for (sampled from time_sessions, so heavy users are more likely)
+SAMPLED_USERS = 3
+SEED = SimpleNamespace(
+    users=300, start_index=0, mean_sessions=20, max_sessions=2000, days=365,
+    lock_ratio=0.05, batch_size=1000, concurrency=4, seed=42
+)
+
+def queries(user_id, email: str, since: int) -> List[Dict]:
+    """Every query issued by the routes and background services, as explain commands.
+
+    Keep in sync with the queries in the code: each entry names where it comes from.
+    """
+    now = datetime.utcnow()
+    week_ago = now - timedelta(days=7)
+    retention_cutoff = now - timedelta(days=180)
+    return [
+        # routes/auth.py: register duplicate check, login
+        {"name": "users by email", "explain": {"find": "users", "filter": {"email": email}, "limit": 1}},
+        # /auth/me, stats, sync
+        {"name": "users by _id", "explain": {"find": "users", "filter": {"_id": user_id}, "limit": 1}},
+        # add_time_saved: total update guarded by the Idempotency-Key
+        {"name": "users $inc by _id unless key applied", "explain": {
+            "findAndModify": "users", "query": {"_id": user_id, "applied_keys": {"$ne": "probe"}},
+            "update": {"$inc": {"time_saved": 1, "change_version": 1},
+                       "$push": {"applied_keys": {"$each": ["probe"], "$slice": -20}}}, "new": True
+        }},
+        # add_time_saved: replay of a key applied by an earlier attempt
+        {"name": "users by applied key", "explain": {
+            "find": "users", "filter": {"_id": user_id, "applied_keys": "seed-0"}, "limit": 1
+        }},
+        # next_change_version
+        {"name": "users $inc by _id", "explain": {
+            "findAndModify": "users", "query": {"_id": user_id},
+            "update": {"$inc": {"change_version": 1}}, "new": True
+        }},
+        # get_preferences, sync (full)
+        {"name": "preferences by user", "explain": {"find": "user_preferences", "filter": {"user_id": user_id}, "limit": 1}},
+        # sync (delta)
+        {"name": "preferences by user since version", "may_be_empty": True, "explain": {
+            "find": "user_preferences", "filter": {"user_id": user_id, "version": {"$gte": since}}, "limit": 1
+        }},
+        # update_preferences (lock-aware conditional update)
+        {"name": "preferences lock-aware update", "may_be_empty": True, "explain": {
+            "findAndModify": "user_preferences",
+            "query": {"user_id": user_id, "$or": [
+                {"lock_mode": {"$ne": True}}, {"lock_end_time": None}, {"lock_end_time": {"$lte": now}}
+            ]},
+            "update": {"$set": {"updated_at": now}}, "new": True
+        }},
+        # get_user_stats: count_documents runs as an aggregation
+        {"name": "sessions count by user", "explain": {
+            "aggregate": "time_sessions",
+            "pipeline": [{"$match": {"user_id": user_id}}, {"$group": {"_id": 1, "n": {"$sum": 1}}}],
+            "cursor": {}
+        }},
+        # get_user_stats: last 7 days
+        {"name": "sessions last week", "may_be_empty": True, "explain": {
+            "find": "time_sessions", "filter": {"user_id": user_id, "created_at": {"$gte": week_ago}},
+            "projection": {"time_saved": 1}
+        }},
+        # sync: sessions since version
+        {"name": "sessions since version", "explain": {
+            "find": "time_sessions", "filter": {"user_id": user_id, "version": {"$gte": since}},
+            "sort": {"version": 1}, "limit": 501
+        }},
+        # session_tracker: checkpoint and close of heartbeat-tracked sessions
+        {"name": "usage session upsert", "explain": {
+            "update": "usage_sessions",
+            "updates": [{"q": {"user_id": user_id, "client_session_id": "seed-0"},
+                         "u": {"$inc": {"time_spent": 10}, "$max": {"end_time": now}}, "upsert": True}]
+        }},
+        # achievements replay
+        {"name": "sessions history for replay", "explain": {
+            "find": "time_sessions", "filter": {"user_id": user_id},
+            "projection": {"time_saved": 1, "created_at": 1}, "sort": {"created_at": 1}
+        }},
+        # purge: next batch of a deleted account's sessions
+        {"name": "account purge sessions batch", "explain": {
+            "find": "time_sessions", "filter": {"user_id": user_id},
+            "projection": {"created_at": 1}, "sort": {"created_at": 1}, "limit": 500
+        }},
+        {"name": "account purge usage sessions batch", "explain": {
+            "find": "usage_sessions", "filter": {"user_id": user_id},
+            "projection": {"created_at": 1}, "sort": {"created_at": 1}, "limit": 500
+        }},
+        # purge: next batch of expired sessions of every user
+        {"name": "retention sessions batch", "explain": {
+            "find": "time_sessions", "filter": {"created_at": {"$lt": retention_cutoff}},
+            "projection": {"created_at": 1}, "sort": {"created_at": 1}, "limit": 500
+        }},
+        {"name": "retention usage sessions batch", "may_be_empty": True, "explain": {
+            "find": "usage_sessions", "filter": {"created_at": {"$lt": retention_cutoff}},
+            "projection": {"created_at": 1}, "sort": {"created_at": 1}, "limit": 500
+        }},
+        # purge: claim the oldest job that may start
+        {"name": "purge job claim", "explain": {
+            "findAndModify": "purge_jobs",
+            "query": {"$or": [
+                {"status": "pending", "run_after": {"$not": {"$gt": now}}},
+                {"status": "running", "lease_until": {"$lt": now}}
+            ]},
+            "sort": {"created_at": 1},
+            "update": {"$set": {"status": "running", "updated_at": now}}, "new": True
+        }},
+        # stats and sync: achievements state
+        {"name": "achievements by user", "explain": {"find": "user_achievements", "filter": {"user_id": user_id}, "limit": 1}},
+        # lock_state: startup load and expired-lock cleanup
+        {"name": "active locks", "may_be_empty": True, "explain": {
+            "find": "user_preferences", "filter": {"lock_mode": True, "lock_end_time": {"$gt": now}},
+            "projection": {"user_id": 1, "lock_end_time": 1}
+        }},
+        {"name": "expired locks at startup", "may_be_empty": True, "explain": {
+            "find": "user_preferences", "filter": {"lock_mode": True, "lock_end_time": {"$lte": now}},
+            "projection": {"user_id": 1}
+        }},
+        {"name": "expired locks of due users", "may_be_empty": True, "explain": {
+            "find": "user_preferences",
+            "filter": {"user_id": {"$in": [user_id]}, "lock_mode": True, "lock_end_time": {"$lte": now}},
+            "projection": {"user_id": 1}
+        }},
+        {"name": "expired locks version bump", "explain": {
+            "update": "users",
+            "updates": [{"q": {"_id": {"$in": [user_id]}}, "u": {"$inc": {"change_version": 1}}, "multi": True}]
+        }},
+        {"name": "expired lock cleanup", "may_be_empty": True, "explain": {
+            "update": "user_preferences",
+            "updates": [{"q": {"user_id": user_id, "lock_mode": True, "lock_end_time": {"$lte": now}},
+                         "u": {"$set": {"lock_mode": False}, "$max": {"version": 1}}}]
+        }},
+        # GET /stats/global: every shard of today's counters
+        {"name": "global counters by day", "explain": {
+            "find": "global_counters", "filter": {"day": now.date().isoformat()},
+            "projection": {"platform": 1, "minutes": 1, "sessions": 1}
+        }},
+        # idempotency replay
+        {"name": "idempotency key", "explain": {"find": "idempotency_keys", "filter": {"_id": f"{user_id}:seed-0"}, "limit": 1}},
+    ]
+
+def find_stages(plan, found=None) -> List[str]:
+    """All stage names in a (possibly nested) plan"""
+    found = [] if found is None else found
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            found.append(plan["stage"])
+        for value in plan.values():
+            find_stages(value, found)
+    elif isinstance(plan, list):
+        for item in plan:
+            find_stages(item, found)
+    return found
+
+def execution_stats(explain: Dict) -> Dict:
+    """executionStats, whether top level or inside an aggregation's $cursor stage"""
+    if "executionStats" in explain:
+        return explain["executionStats"]
+    for stage in explain.get("stages", []):
+        if "$cursor" in stage:
+            return stage["$cursor"].get("executionStats", {})
+    return {}
+
+def winning_plan(explain: Dict) -> Dict:
+    planner = explain.get("queryPlanner")
+    if planner is None:
+        for stage in explain.get("stages", []):
+            if "$cursor" in stage:
+                planner = stage["$cursor"].get("queryPlanner")
+    return (planner or {}).get("winningPlan", {})
+
+def mongo_reachable(url: str) -> bool:
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    client = MongoClient(url, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+async def explain_all() -> Dict[str, List[Dict]]:
+    """Seed a scratch database and explain every query; results by query name"""
+    from scripts.seed_data import Seeder
+
+    db = database.database
+    await Seeder(db, SEED).run()
+
+    results: Dict[str, List[Dict]] = {}
+    samples = await db.time_sessions.aggregate([
+        {"$sample": {"size": SAMPLED_USERS}}, {"$project": {"user_id": 1}}
+    ]).to_list(None)
+    for sample in samples:
+        user = await db.users.find_one({"_id": sample["user_id"]}, {"email": 1, "change_version": 1})
+        since = max(user.get("change_version", 0) - 20, 0)
+        for query in queries(user["_id"], user["email"], since):
+            explain = await db.command({"explain": query["explain"], "verbosity": "executionStats"})
+            stats = execution_stats(explain)
+            results.setdefault(query["name"], []).append({
+                "user_id": user["_id"],
+                "may_be_empty": query.get("may_be_empty", False),
+                "stages": find_stages(winning_plan(explain)),
+                "examined": stats.get("totalDocsExamined", 0),
+                # Write explains report matched documents rather than returned ones
+                "returned": max(stats.get("nReturned", 0), stats.get("executionStages", {}).get("nMatched", 0))
+            })
+    return results
+
+@pytest.fixture(scope="module")
+def plans():
+    settings = get_settings()
+    if not mongo_reachable(settings.mongo_url):
+        pytest.skip(f"no MongoDB server reachable at {settings.mongo_url}")
+
+    async def run():
+        # connect_to_mongo creates the same indexes the app relies on, in the scratch database
+        await connect_to_mongo()
+        try:
+            return await explain_all()
+        finally:
+            await database.client.drop_database(settings.db_name)
+            await close_mongo_connection()
+
+    app_db_name = settings.db_name
+    settings.db_name = f"icare_plans_{uuid.uuid4().hex[:8]}"
+    try:
+        yield asyncio.run(run())
+    finally:
+        settings.db_name = app_db_name
+
+@pytest.mark.parametrize("name", [query["name"] for query in queries(ObjectId(), "", 0)])
+def test_query_plan(plans, name):
+    assert plans.get(name), f"{name} was not explained"
+    if not plans[name][0]["may_be_empty"]:
+        assert any(result["returned"] for result in plans[name]), f"{name} matched nothing, the seed does not cover it"
+    for result in plans[name]:
+        stages = " > ".join(reversed(result["stages"]))
+        assert "COLLSCAN" not in result["stages"], f"COLLSCAN for user {result['user_id']}: {stages}"
+        ratio = result["examined"] / max(result["returned"], 1)
+        assert ratio <= MAX_RATIO, (
+            f"examined {result['examined']} for {result['returned']} returned (user {result['user_id']}): {stages}"
+        )
@@ -0,0 +1,122 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from config import get_settings
+from session_tracker import HEARTBEAT_INTERVAL_SECONDS, HEARTBEAT_SLACK_SECONDS, SessionTracker, session_tracker
+
+@pytest.fixture
+def tracker(db, monkeypatch):
+    from mongomock_motor import AsyncMongoMockCollection
+
+    tracker = SessionTracker()
+    tracker._db = db
+    tracker.bulk_writes = []
+    bulk_write = AsyncMongoMockCollection.bulk_write
+
+    async def recording_bulk_write(collection, requests, **kwargs):
+        tracker.bulk_writes.append(len(requests))
+        return await bulk_write(collection, requests, **kwargs)
+
+    monkeypatch.setattr(AsyncMongoMockCollection, "bulk_write", recording_bulk_write)
+    return tracker
+
+def usage(db):
+    return {
+        doc["client_session_id"]: doc["time_spent"]
+        for doc in asyncio.run(db.usage_sessions.find({}).to_list(None))
+    }
+
+def test_checkpoint_writes_every_session_in_one_bulk_write(tracker, db):
+    user_id = "a" * 24
+    for session_id in ("s1", "s2", "s3"):
+        tracker.heartbeat(user_id, session_id, "instagram", 5)
+    tracker._sessions[(user_id, "s3")].last_seen -= timedelta(seconds=get_settings().session_idle_seconds + 1)
+
+    asyncio.run(tracker._checkpoint())
+
+    assert tracker.bulk_writes == [3]
+    assert usage(db) == {"s1": 5, "s2": 5, "s3": 5}
+    # Idle sessions are forgotten, the others stay open with nothing pending
+    assert set(tracker._sessions) == {(user_id, "s1"), (user_id, "s2")}
+    asyncio.run(tracker._checkpoint())
+    assert tracker.bulk_writes == [3]
+
+def test_checkpoints_add_up_on_the_same_document(tracker, db):
+    user_id = "a" * 24
+    tracker.heartbeat(user_id, "s1", "youtube", 10)
+    asyncio.run(tracker._checkpoint())
+    tracker._sessions[(user_id, "s1")].last_seen -= timedelta(seconds=10)
+    tracker.heartbeat(user_id, "s1", "youtube", 10)
+    asyncio.run(tracker.close(user_id, "s1"))
+
+    assert usage(db) == {"s1": 20}
+    assert tracker.metrics()["open"] == 0
+
+def test_elapsed_is_capped_by_the_time_since_the_last_heartbeat(tracker):
+    user_id = "a" * 24
+    # A session new to this worker counts at most one heartbeat period
+    session = tracker.heartbeat(user_id, "s1", "instagram", 45)
+    assert session.pending_seconds == HEARTBEAT_INTERVAL_SECONDS + HEARTBEAT_SLACK_SECONDS
+
+    session.pending_seconds = 0
+    session.last_seen -= timedelta(seconds=3)
+    tracker.heartbeat(user_id, "s1", "instagram", 45)
+    assert session.pending_seconds <= 3 + HEARTBEAT_SLACK_SECONDS
+
+    # Rapid-fire heartbeats add only the slack each
+    session.pending_seconds = 0
+    for _ in range(10):
+        tracker.heartbeat(user_id, "s1", "instagram", 45)
+    assert session.pending_seconds <= 10 * HEARTBEAT_SLACK_SECONDS
+
+def test_open_sessions_per_user_are_bounded(tracker):
+    limit = get_settings().session_max_per_user
+    for number in range(limit):
+        assert tracker.heartbeat("a" * 24, f"s{number}", "instagram", 0) is not None
+    assert tracker.heartbeat("a" * 24, "one-too-many", "instagram", 0) is None
+    # Other users and known sessions are unaffected
+    assert tracker.heartbeat("b" * 24, "s0", "instagram", 0) is not None
+    assert tracker.heartbeat("a" * 24, "s0", "instagram", 0) is not None
+
+    asyncio.run(tracker.close("a" * 24, "s0"))
+    assert tracker.heartbeat("a" * 24, "one-too-many", "instagram", 0) is not None
+
+def test_failed_write_gives_activity_back(tracker, monkeypatch):
+    from mongomock_motor import AsyncMongoMockCollection
+
+    async def fail(collection, requests, **kwargs):
+        raise RuntimeError("primary stepped down")
+
+    tracker.heartbeat("a" * 24, "s1", "instagram", 7)
+    monkeypatch.setattr(AsyncMongoMockCollection, "bulk_write", fail)
+    with pytest.raises(RuntimeError):
+        asyncio.run(tracker.close("a" * 24, "s1"))
+
+    session = tracker._sessions[("a" * 24, "s1")]
+    assert session.pending_seconds == 7
+    assert tracker._open_per_user["a" * 24] == 1
+
+def test_heartbeat_route_records_usage_apart_from_time_saved(client, db, user):
+    user_id, headers = user
+    body = {"session_id": "visit-1", "platform": "tiktok", "elapsed": 0}
+    session_tracker._db = db
+    assert client.post("/api/user/sessions/heartbeat", json=body, headers=headers).status_code == 200
+    assert client.post("/api/user/sessions/heartbeat", json=dict(body, ended=True), headers=headers).status_code == 200
+
+    assert asyncio.run(db.usage_sessions.count_documents({"user_id": user_id})) == 1
+    stats = client.get("/api/user/stats", headers=headers).json()
+    assert stats["total_sessions"] == 0
+
+def test_heartbeat_route_refuses_too_many_sessions(client, db, user):
+    user_id, headers = user
+    session_tracker._db = db
+    statuses = [
+        client.post("/api/user/sessions/heartbeat", json={"session_id": f"visit-{number}"}, headers=headers).status_code
+        for number in range(get_settings().session_max_per_user + 1)
+    ]
+    assert statuses[-1] == 429
+    assert set(statuses[:-1]) == {200}
+    for number in range(len(statuses) - 1):
+        session_tracker._remove(session_tracker._sessions[(str(user_id), f"visit-{number}")])
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    executions = 0
+
+    async def load():
+        nonlocal executions
+        executions += 1
+        await asyncio.sleep(0.01)
+        return {"value": executions}
+
+    async def run():
+        return await asyncio.gather(*(flight.do(("prefs", "u1"), load) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert executions == 1
+    assert all(result is results[0] for result in results)
+    assert flight.metrics() == {"prefs": {"executed": 1, "avoided": 4}}
+
+def test_different_keys_and_later_calls_run_again():
+    flight = SingleFlight()
+    executions = []
+
+    async def load(key):
+        executions.append(key)
+        await asyncio.sleep(0)
+        return key
+
+    async def run():
+        await asyncio.gather(flight.do(("prefs", "u1"), lambda: load("u1")), flight.do(("prefs", "u2"), lambda: load("u2")))
+        # Nothing is cached once the call completed
+        await flight.do(("prefs", "u1"), lambda: load("u1"))
+
+    asyncio.run(run())
+    assert executions == ["u1", "u2", "u1"]
+
+def test_exception_reaches_every_caller():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    flight = SingleFlight()
+
+    async def load():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def run():
+        first = asyncio.ensure_future(flight.do("key", load))
+        second = asyncio.ensure_future(flight.do("key", load))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "done"
@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import routes.user
+from database import next_change_version
+
+def sync(client, headers, since=0):
+    response = client.get("/api/user/sync", params={"since": since}, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+def save_time(client, headers, minutes):
+    assert client.post("/api/user/time-saved", json={"minutes": minutes}, headers=headers).status_code == 200
+
+def settle(db, user_id):
+    """Move every version allocation past the settle window"""
+    user = asyncio.run(db.users.find_one({"_id": user_id}))
+    times = [at - timedelta(minutes=5) for at in user.get("change_version_times", [])]
+    asyncio.run(db.users.update_one({"_id": user_id}, {"$set": {"change_version_times": times}}))
+
+def test_sync_right_after_a_write_returns_its_version(client, user):
+    _user_id, headers = user
+    save_time(client, headers, 10)
+    save_time(client, headers, 20)
+
+    payload = sync(client, headers)
+    assert payload["version"] == 2
+    assert [session["time_saved"] for session in payload["sessions"]] == [10, 20]
+    assert payload["totals"]["time_saved"] == 30
+    assert payload["preferences"] is None
+
+def test_delta_sync_sends_what_changed_since(client, user):
+    _user_id, headers = user
+    save_time(client, headers, 10)
+    since = sync(client, headers)["version"]
+    save_time(client, headers, 15)
+    client.put("/api/user/preferences", json={"hide_reels": True}, headers=headers)
+
+    payload = sync(client, headers, since + 1)
+    assert payload["version"] == since + 2
+    assert [session["time_saved"] for session in payload["sessions"]] == [15]
+    assert payload["preferences"]["hide_reels"] is True
+
+    # Nothing new: only what is stamped at `since` comes again
+    payload = sync(client, headers, payload["version"])
+    assert payload["sessions"] == []
+    assert payload["preferences"]["hide_reels"] is True
+
+def test_version_of_a_write_in_flight_is_not_skipped(client, db, user):
+    user_id, headers = user
+    save_time(client, headers, 10)
+    # Allocated by a write that has not stamped its document yet
+    in_flight = asyncio.run(next_change_version(db, user_id))
+    save_time(client, headers, 20)
+
+    payload = sync(client, headers)
+    assert payload["version"] == in_flight - 1
+    assert len(payload["sessions"]) == 2
+
+    # The write never finished: once the deadline passed, the version is skipped
+    settle(db, user_id)
+    assert sync(client, headers, payload["version"])["version"] == in_flight + 1
+
+def test_paging_resumes_after_the_last_session(client, user, monkeypatch):
+    _user_id, headers = user
+    monkeypatch.setattr(routes.user, "SYNC_MAX_SESSIONS", 2)
+    for minutes in (1, 2, 3, 4, 5):
+        save_time(client, headers, minutes)
+
+    received, since, pages = [], 0, 0
+    while True:
+        payload = sync(client, headers, since)
+        received += [session["time_saved"] for session in payload["sessions"] if session["time_saved"] not in received]
+        since, pages = payload["version"] + 1, pages + 1
+        if not payload["has_more"]:
+            break
+    assert received == [1, 2, 3, 4, 5]
+    assert pages == 3
+
+def test_rejected_update_does_not_allocate_a_version(client, db, user):
+    user_id, headers = user
+    lock_end = (datetime.utcnow() + timedelta(hours=1)).isoformat()
+    assert client.put("/api/user/preferences", json={"lock_mode": True, "lock_end_time": lock_end}, headers=headers).status_code == 200
+    version = asyncio.run(db.users.find_one({"_id": user_id}))["change_version"]
+
+    assert client.put("/api/user/preferences", json={"hide_reels": False}, headers=headers).status_code == 403
+    assert asyncio.run(db.users.find_one({"_id": user_id}))["change_version"] == version
+    routes.user.lock_state._locks.pop(str(user_id), None)
+
+def test_lock_expiry_is_reported(client, db, user):
+    user_id, headers = user
+    lock_state = routes.user.lock_state
+    lock_end = datetime.utcnow() + timedelta(hours=1)
+    client.put("/api/user/preferences", json={"lock_mode": True, "lock_end_time": lock_end.isoformat()}, headers=headers)
+    since = sync(client, headers)["version"]
+
+    asyncio.run(db.user_preferences.update_one({"user_id": user_id}, {"$set": {"lock_end_time": datetime.utcnow()}}))
+    lock_state._db = db
+    asyncio.run(lock_state._clear_locks([user_id], datetime.utcnow()))
+    lock_state._locks.pop(str(user_id), None)
+
+    payload = sync(client, headers, since + 1)
+    assert payload["version"] == since + 1
+    assert payload["preferences"]["lock_mode"] is False